@@ -11,8 +11,17 @@ from game.game_utils import get_env_action, get_distance_traveled, get_row_to_st
     column_names
 # Offline Gradient Updates Scheduler
 from game.updates_scheduler import UpdatesScheduler
-# Virtual environment
-from maze3D_new.assets import *
+# Background sampling of the mini-batches
+from rl_models.buffer import BatchPrefetcher
+# Background training of the agent
+from rl_models.learner import AsyncLearner, ProcessLearner
+# Fast inference of the discrete SAC agent's actions
+from rl_models.networks_discrete import NumpyActor
+# Background computation of the discrete SAC agent's actions
+from rl_models.policy_worker import PolicyWorker
+
+# the offline gradient updates whose mini-batches are sampled together
+updates_per_sample = 100
 
 # to track memory leaks
 from pympler.tracker import SummaryTracker
@@ -40,7 +49,26 @@ class Experiment:
         self.max_games = config['Experiment'][self.mode]['max_games']
         self.log_interval = self.config['Experiment'][self.mode]['log_interval']
         self.isAgent_discrete = config['SAC']['discrete'] if 'SAC' in config.keys() else None
+        # the mini-batches sampled ahead of the offline gradient updates. 0 to sample them in the update loop
+        self.prefetch_batches = config['Experiment'].get('prefetch_batches', 4)
         self.second_human = config['game']['second_human'] if 'game' in config.keys() else None
+        # train the (discrete SAC) agent in a background thread or process while the games are played
+        self.learner = None
+        async_learner = config['Experiment'].get('async_learner', False)
+        if async_learner and self.isAgent_discrete and not self.second_human and not config['game']['test_model']:
+            learner = ProcessLearner if async_learner == 'process' else AsyncLearner
+            self.learner = learner(self.agent, updates_per_sample)
+        # decide the discrete agent's actions with a NumPy copy of its actor, reloaded after the actor is trained
+        self.numpy_actor = None
+        if self.isAgent_discrete and not self.second_human and config['SAC'].get('numpy_inference', False):
+            self.numpy_actor = NumpyActor(self.agent.actor)
+        # counts the training sessions of the actor without a learner
+        self.actor_version, self.numpy_actor_version = 0, 0
+        # compute the discrete agent's next action in the background, from the observation of every physics tick
+        self.policy_worker = None
+        if self.isAgent_discrete and not self.second_human and config['Experiment'].get('async_policy', False):
+            self.policy_worker = PolicyWorker(self.sample_agent_action)
+            self.env.observer = self.policy_worker.observe
         if not config['game']['human_alone']:
             self.max_score = config['Experiment']['test_loop']['max_score']
             self.test_model = config['game']['test_model']
@@ -57,6 +85,8 @@ class Experiment:
         # train
         self.distance_travel_list, self.reward_list, self.game_duration_list = [], [], []
         self.online_update_duration_list, self.train_step_duration_list, self.grad_updates_durations = [], [], []
+        # with a learner: the time the games waited to request the offline updates, performed in the background
+        self.grad_updates_request_durations = []
         self.action_history, self.score_history, self.episode_duration_list, self.length_list = [], [], [], []
         # test
         self.test_reward_list, self.test_step_duration_list, self.test_score_history = [], [], []
@@ -123,7 +153,7 @@ class Experiment:
                 redundant_end_duration += duration_pause  # keep track of the total paused time
 
                 # check if the game has timed out
-                if time.time() - start_game_time - redundant_end_duration >= self.max_game_duration:
+                if self.env.is_timed_out(start_game_time, redundant_end_duration, self.max_game_duration):
                     timed_out = True
 
                 # keep track of the fps
@@ -187,6 +217,20 @@ class Experiment:
                                                     self.total_steps, i_game, self.total_steps, running_reward,
                                                     avg_length, self.log_interval, avg_game_duration)
 
+        if self.policy_worker is not None:
+            # stop the worker before the learner, whose policy it reads
+            self.env.observer = None
+            self.policy_worker.close()
+            if self.policy_worker.staleness:
+                print("Agent's action staleness: mean {:.1f}, max {} physics ticks".format(
+                    np.mean(self.policy_worker.staleness), np.max(self.policy_worker.staleness)))
+        if self.learner is not None:
+            # finish the requested updates and save the models
+            self.learner.close()
+            print("The learner trained for {:.1f} sec in the background".format(self.learner.busy_time))
+            if getattr(self.learner, 'dropped', 0):
+                print("The learner dropped {} transitions".format(self.learner.dropped))
+
         tracker.print_diff()  # to track memory leaks
 
     def test_max_games_mode(self, randomness_criterion):
@@ -220,7 +264,7 @@ class Experiment:
 
                 redundant_end_duration += duration_pause  # keep track of the total paused time
 
-                if time.time() - start_game_time - redundant_end_duration >= self.test_max_duration:
+                if self.env.is_timed_out(start_game_time, redundant_end_duration, self.test_max_duration):
                     timed_out = True
 
                 # keep track of the fps
@@ -303,7 +347,7 @@ class Experiment:
                 redundant_end_duration += duration_pause  # keep track of the total paused time
 
                 # check if the game has timed out
-                if time.time() - start_game_time - redundant_end_duration >= self.max_game_duration:
+                if self.env.is_timed_out(start_game_time, redundant_end_duration, self.max_game_duration):
                     timed_out = True
 
                 # keep track of the fps
@@ -378,7 +422,9 @@ class Experiment:
         observation, agent_action, reward, observation_, done = interaction
         # we play with the RL agent
         if not self.second_human:
-            if self.isAgent_discrete:
+            if self.learner is not None:
+                self.learner.add(observation, agent_action, reward, observation_, done)
+            elif self.isAgent_discrete:
                 self.agent.memory.add(observation, agent_action, reward, observation_, done)
             else:
                 self.agent.remember(observation, agent_action, reward, observation_, done)
@@ -394,17 +440,27 @@ class Experiment:
         # we play with the RL agent
         if not self.second_human:
             print("Performing {} updates".format(update_cycles))
+            # the updates are performed updates_per_sample at a time, sampling their mini-batches at once
+            chunks = [min(updates_per_sample, update_cycles - start)
+                      for start in range(0, update_cycles, updates_per_sample)]
             # print a completion bar in the terminal
-            for _ in tqdm(range(update_cycles)):
-                if self.isAgent_discrete:
-                    # train the agent's networks
-                    self.agent.learn()
-                    # update the target networks
-                    self.agent.soft_update_target()
-                # continuous SAC agent
+            with tqdm(total=update_cycles) as progress:
+                if self.isAgent_discrete and not self.agent.prioritized_replay and self.prefetch_batches > 0:
+                    # the mini-batches of the next chunks are sampled in the background during the updates
+                    sizes = iter(chunks)
+                    with BatchPrefetcher(lambda: self.agent.sample_batches(next(sizes)), len(chunks),
+                                         self.prefetch_batches) as prefetcher:
+                        for k in chunks:
+                            self.agent.learn_many(k, batches=prefetcher.get())
+                            progress.update(k)
                 else:
-                    # train the agent's networks
-                    self.agent.learn()
+                    # with prioritized replay every mini-batch is sampled after the previous update, from the
+                    # current priorities
+                    for k in chunks:
+                        # train the agent's networks (and update the target networks)
+                        self.agent.learn_many(k)
+                        progress.update(k)
+            self.actor_version += 1
             end_grad_updates = time.time()
 
         return end_grad_updates - start_grad_updates
@@ -436,7 +492,11 @@ class Experiment:
             # use the agent to decide the next action
             else:
                 self.save_models = True  # now it is time to start saving the model since we will be training it.
-                agent_action = self.agent.actor.sample_act(observation)  # get agent's decision of the next action
+                if self.policy_worker is not None:
+                    # the latest action of the agent, computed in the background
+                    agent_action = self.policy_worker.get_action(observation, self.env.game_ticks)
+                else:
+                    agent_action = self.sample_agent_action(observation)  # get agent's decision of the next action
                 # flag is use to print message only the first time we start to use the agent
                 if not self.flag:
                     print("Using SAC Agent")
@@ -448,6 +508,24 @@ class Experiment:
 
         return agent_action
 
+    def sample_agent_action(self, observation):
+        """
+        Samples the discrete SAC agent's action with the latest weights of its actor.
+        :param observation: the observation, based on which to calculate action
+        :return: agent's action
+        """
+        if self.learner is not None:
+            # act with the latest weights published by the learner
+            actor, version = self.learner.policy, self.learner.sync_policy()
+        else:
+            actor, version = self.agent.actor, self.actor_version
+        if self.numpy_actor is None:
+            return actor.sample_act(observation)
+        if self.numpy_actor_version != version:
+            self.numpy_actor.load(actor)
+            self.numpy_actor_version = version
+        return self.numpy_actor.sample_act(observation)
+
     def update_best_reward(self, game_reward):
         """
         Updates the best reward so far
@@ -511,11 +589,15 @@ class Experiment:
             # check if we should do online updates
             if self.config['Experiment']['online_updates'] and i_game >= \
                     self.config['Experiment'][self.mode]['start_training_step_on_game']:
-                if self.isAgent_discrete:
+                if self.learner is not None:
+                    # the update is performed by the learner in the background
+                    self.learner.learn(1)
+                elif self.isAgent_discrete:
                     # train the agent's networks
                     self.agent.learn()
                     # update the target networks
                     self.agent.soft_update_target()
+                    self.actor_version += 1
         # update the time needed for this update
         self.online_update_duration_list.append(time.time() - start_online_update)
 
@@ -544,7 +626,14 @@ class Experiment:
                 print("Max games: {}".format(self.max_games))
                 print("Max duration of each game: {}".format(self.max_game_duration))
 
-                if self.update_cycles > 0:
+                if self.update_cycles > 0 and self.learner is not None:
+                    # the learner performs the updates and then saves the models while the next games are played,
+                    # so the games only wait for the request. the learner's busy_time is the duration of the updates
+                    start_grad_updates = time.time()
+                    self.learner.learn(self.update_cycles)
+                    self.learner.save_models()
+                    self.grad_updates_request_durations.append(time.time() - start_grad_updates)
+                elif self.update_cycles > 0:
                     # perform an offline gradient update
                     grad_updates_duration = self.grad_updates(self.update_cycles)
                     # keep track of its duration
@@ -559,6 +648,9 @@ class Experiment:
         :param i_game: current game
         """
         if i_game % self.test_interval == 0 and self.test_max_games > 0:
+            if self.learner is not None:
+                # test the models trained by the updates requested so far, as without a learner
+                self.learner.wait()
             self.test_max_games_mode(randomness_criterion=None)
             print("Continue Training.")
 
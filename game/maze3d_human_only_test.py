@@ -1,6 +1,5 @@
 # Virtual environment
 from maze3D_new.Maze3DEnv import Maze3D as Maze3D_v2
-from maze3D_new.assets import *
 from maze3D_new.utils import save_logs_and_plot
 
 # Experiment
@@ -42,7 +41,7 @@ def main(argv):
 
     print('Total Experiment time: {}'.format(experiment_duration))
 
-    pg.quit()
+    maze.close()
 
 
 if __name__ == '__main__':
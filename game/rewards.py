@@ -1,5 +1,9 @@
+import numpy as np
 from maze3D_new.utils import get_distance_from_goal
 
+# the reward functions of reward_function_maze, in lower case
+reward_types = ["timeout", "distance", "shafti"]
+
 
 def main(config):
 	global reward_type
@@ -13,6 +17,16 @@ def reward_function_maze(goal_reached, timedout, ball, goal=None):
 	elif reward_type in ["Shafti", "shafti"]:
 		return reward_function_shafti(goal_reached)
 
+def reward_function_maze_batch(goal_reached, timedout, distance):
+	# reward_function_maze for a batch of boards
+	# goal_reached, timedout: boolean arrays. distance: the distances of the balls from the goal
+	if reward_type in ["Timeout", "timeout"]:
+		return np.where(goal_reached, 100, np.where(timedout, -50, -1))
+	elif reward_type in ["Distance", "distance"]:
+		return np.where(goal_reached, 100, np.where(timedout, -50, distance))
+	elif reward_type in ["Shafti", "shafti"]:
+		return np.where(goal_reached, 100, -1)
+
 def reward_function_timeout_penalty(goal_reached, timedout):
 	# for every timestep -1
 	# timed out -50
@@ -1,6 +1,5 @@
 # Virtual environment
 from maze3D_new.Maze3DEnv import Maze3D as Maze3D_v2
-from maze3D_new.assets import *
 from maze3D_new.utils import save_logs_and_plot
 
 # Experiment
@@ -64,7 +63,7 @@ def main(argv):
             # save rest of the experiment logs and plot them
             save_logs_and_plot(experiment, chkpt_dir, plot_dir, experiment.max_games)
             experiment.save_info(chkpt_dir, experiment_duration, experiment.max_games)
-    pg.quit()
+    maze.close()
 
 
 if __name__ == '__main__':
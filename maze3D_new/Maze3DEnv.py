@@ -1,9 +1,10 @@
 import random
+import time
+import numpy as np
 # Reward functions
 from game import rewards
 # Virtual environment
-from maze3D_new.gameObjects import *
-from maze3D_new.assets import *
+from maze3D_new.gameObjects import GameBoard
 from maze3D_new.utils import checkTerminal, convert_actions
 from maze3D_new.layouts import layout_up_right, layout_down_right, layout_up_left, layout_10_up_right
 # RL modules
@@ -31,6 +32,8 @@ class ActionSpace:
 
 class Maze3D:
     """The environment wrapper for the Maze3D game"""
+    # the size of the array of clone_state
+    state_size = GameBoard.state_size + 2
 
     def __init__(self, config=None, config_file=None):
         # get the configuration dictionary
@@ -42,12 +45,27 @@ class Maze3D:
         self.discrete_input = self.config['game']['discrete_input']
         # check if playing with agent or with 2 humans
         self.rl = True if 'SAC' in self.config.keys() else False
+        # run the physics only, without opening the game window (no human in the loop)
+        self.headless = self.config['game'].get('headless', False)
+        # only the agent plays, no human in the loop
+        self.agent_only = self.config['game'].get('agent_only', False)
+        # draw the game every render_every physics ticks, never if 0
+        self.render_every = 0 if self.headless else self.config['game'].get('render_every', 1)
+        # the fps to run the game in. in simulation time, the physics ticks per simulated second
+        self.fps = 60
+        # the physics ticks per second while drawing the game
+        self.physics_fps = self.config['game'].get('physics_fps', self.fps)
+        # count the duration of the actions and the games in physics ticks instead of seconds. always on when the
+        # physics are not paced to real time, i.e. when they run unpaced (no drawing) or faster/slower than fps
+        self.simulation_time = self.headless or self.render_every == 0 or self.physics_fps != self.fps or \
+            self.config['game'].get('simulation_time', False)
         # create the game board
         self.board = GameBoard(current_layout, self.discrete_input, self.rl)
-        # create the key dictionary
-        self.keys = {pg.K_UP: 1, pg.K_DOWN: 2, pg.K_LEFT: 4, pg.K_RIGHT: 8}
-        # create conversion key dictionary
-        self.conversion_keys = {pg.K_UP: 0, pg.K_DOWN: 1, pg.K_LEFT: 2, pg.K_RIGHT: 3}
+        # create the renderer of the board. importing it opens the game window
+        self.renderer = None
+        if not self.headless:
+            from maze3D_new.renderer import Renderer
+            self.renderer = Renderer(self.board)
         # boolean that check if game has finished
         self.done = False
         # get the initial state of the board
@@ -56,8 +74,10 @@ class Maze3D:
         self.action_space = ActionSpace()
         # get the shape of the observation space
         self.observation_shape = (len(self.observation),)
-        # the fps to run the game in
-        self.fps = 60
+        # the physics ticks performed in the current game
+        self.game_ticks = 0
+        # function called with the observation and the game ticks after every physics tick, e.g. PolicyWorker.observe
+        self.observer = None
         # retrieve the reward
         rewards.main(self.config)
 
@@ -65,6 +85,10 @@ class Maze3D:
         """
         Performs the action of the agent to the environment for action_duration time.
         Simultaneously, receives input from the user via the keyboard arrows.
+        In simulation time, the action lasts action_duration * fps physics ticks regardless of the time they take.
+        The game is drawn every render_every ticks, pacing the physics to physics_fps ticks per second.
+        Without drawing (headless mode or render_every 0) the ticks are performed as fast as possible.
+        Simulation time is always used without drawing or when physics_fps differs from fps.
         :param action_agent: the action of the agent. make sure it is compatible. if None human used both axes
         :param timed_out: bool variable. true if game has been timed out
         :param goal: the goal of the game
@@ -75,8 +99,11 @@ class Maze3D:
         duration_pause, current_duration_pause, extra_time = 0, 0, 0
         actions = [0, 0, 0, 0]
         action_list = []  # to store all the agent-human action pairs performed to the game.
+        ticks, max_ticks = 0, int(round(action_duration * self.fps))
+        fps = 0
         # perform agent's action for action_duration time
-        while (time.time() - start_time - current_duration_pause) < action_duration and not self.done:
+        while not self.done and (ticks < max_ticks if self.simulation_time else
+                                 (time.time() - start_time - current_duration_pause) < action_duration):
             # get keyboard action from user
             current_duration_pause, _, human_actions = self.getKeyboard(actions)
             duration_pause += current_duration_pause
@@ -88,16 +115,18 @@ class Maze3D:
 
             self.board.handleKeys(action)  # apply action to the environment
             self.board.update()  # update board's rotations
-            glClearDepth(1000.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            self.board.draw()  # render new graphics of the game
-            pg.display.flip()
-
-            clock.tick(self.fps)  # set the fps tick
-            fps = clock.get_fps()  # get the actual fps performed
-
-            pg.display.set_caption("Running at " + str(int(fps)) + " fps")
+            ticks += 1
+            self.game_ticks += 1
+            if not self.render_every:
+                # the physics ticks performed per second
+                fps = ticks / max(time.time() - start_time, 1e-6)
+            elif self.game_ticks % self.render_every == 0:
+                self.renderer.render()  # render new graphics of the game
+                # set the fps tick so that the physics run at physics_fps and get the actual physics ticks per second
+                fps = self.render_every * self.renderer.tick(self.physics_fps / self.render_every)
             self.observation = self.get_state()
+            if self.observer is not None:
+                self.observer(self.observation, self.game_ticks)
             if checkTerminal(self.board.ball, goal):
                 self.done = True
                 extra_time = self.display_terminating_screen()
@@ -109,6 +138,18 @@ class Maze3D:
         reward = rewards.reward_function_maze(self.done, timed_out, ball=self.board.ball, goal=goal)
         return self.observation, reward, self.done, fps, duration_pause, action_list
 
+    def is_timed_out(self, start_game_time, redundant_end_duration, max_duration):
+        """
+        Checks if the current game has lasted max_duration.
+        :param start_game_time: the timestamp that the game started
+        :param redundant_end_duration: duration in the game that is not playable by the user
+        :param max_duration: the max duration of the game in sec
+        :return: True if the game has timed out
+        """
+        if self.simulation_time:
+            return self.game_ticks >= max_duration * self.fps
+        return time.time() - start_game_time - redundant_end_duration >= max_duration
+
     def getKeyboard(self, actions):
         """
         Retrieves human's action from keyboard arrows.
@@ -120,28 +161,9 @@ class Maze3D:
         """
         duration_pause = 0
         self.discrete_input = self.config['game']['discrete_input']
-        if not self.discrete_input:
-            pg.key.set_repeat(10)  # argument states the difference (in ms) between consecutive press events
-        space_pressed = True
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 1
-            if event.type == pg.KEYDOWN:
-                if event.key == pg.K_SPACE and space_pressed:
-                    space_pressed = False
-                    start_pause = time.time()
-                    pause()
-                    end_pause = time.time()
-                    duration_pause += end_pause - start_pause
-                if event.key == pg.K_q:
-                    exit(1)
-                if event.key in self.keys:
-                    actions[self.conversion_keys[event.key]] = 1
-                    # action_human += maze.keys[event.key]
-            if event.type == pg.KEYUP:
-                if event.key in self.keys:
-                    actions[self.conversion_keys[event.key]] = 0
-                    # action_human -= maze.keys[event.key]
+        # no human in the loop in headless mode
+        if not self.headless:
+            duration_pause, actions = self.renderer.get_keyboard(actions, self.discrete_input)
         human_actions = convert_actions(actions)
         return duration_pause, actions, human_actions
 
@@ -150,17 +172,52 @@ class Maze3D:
         ball pos x | ball pos y | ball vel x | ball vel y|  theta(x) | phi(y) |  theta_dot(x) | phi_dot(y)
         :return: the current state of the board
         """
-        return np.asarray(
-            [self.board.ball.x, self.board.ball.y, self.board.ball.velocity[0], self.board.ball.velocity[1],
-             self.board.rot_x, self.board.rot_y, self.board.velocity[0], self.board.velocity[1]])
+        return self.board.cloneState()
+
+    def clone_state(self, out=None):
+        """
+        Snapshot of the game, to branch rollouts or restart from it.
+        :param out: an array of size state_size to store the state in, instead of allocating a new one
+        :return: the state of the board (see get_state), done and the physics ticks of the current game
+        """
+        if out is None:
+            out = np.empty(self.state_size)
+        self.board.cloneState(out[:GameBoard.state_size])
+        out[-2] = self.done
+        out[-1] = self.game_ticks
+        return out
 
-    def reset(self):
+    def restore_state(self, state):
         """
-        Resets the game.
+        Restores the game to a snapshot of clone_state.
+        :param state: an array of size state_size
+        """
+        self.board.restoreState(state[:GameBoard.state_size])
+        self.done = bool(state[-2])
+        self.game_ticks = int(state[-1])
+        self.observation = self.get_state()
+
+    def reset(self, countdown=None):
+        """
+        Resets the game. The board is reused if the same layout is chosen, with the ball and the tray put back in place.
+        :param countdown: True to display the starting countdown. By default, it is only displayed if a human plays
         :return: the initial observation of the game, the set-up duration
         """
-        setting_up_duration = self.display_starting_screen()
-        self.__init__(config=self.config)
+        # choose randomly one starting point for the ball
+        current_layout = random.choice(layouts)
+        if current_layout is self.board.layout:
+            self.board.reset()
+        else:
+            self.board = GameBoard(current_layout, self.discrete_input, self.rl)
+            if self.renderer is not None:
+                self.renderer.set_board(self.board)
+        self.done = False
+        self.game_ticks = 0
+        self.observation = self.get_state()
+
+        if countdown is None:
+            countdown = not self.agent_only
+        setting_up_duration = self.display_starting_screen() if countdown else 0
         return self.observation, setting_up_duration
 
     def display_terminating_screen(self):
@@ -168,15 +225,15 @@ class Maze3D:
         Displays a message to the user when the goal has been reached
         :return: GUI display_duration
         """
+        if self.headless:
+            self.done = True
+            return 0
         display_duration = self.config['GUI']['goal_screen_display_duration']
         timeStart = time.time()
         i = 0
         self.board.update()
         while time.time() - timeStart <= display_duration:
-            glClearDepth(1000.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            self.board.draw(mode=2, idx=i)  # mode: 2 for reaching goal
-            pg.display.flip()
+            self.renderer.render(mode=2, idx=i)  # mode: 2 for reaching goal
             time.sleep(1)
             i += 1
         self.done = True
@@ -187,15 +244,15 @@ class Maze3D:
         Displays a timeout message to the user
         :return: GUI display_duration
         """
+        if self.headless:
+            self.done = True
+            return 0
         display_duration = self.config['GUI']['timeout_screen_display_duration']
         timeStart = time.time()
         i = 0
         self.board.update()
         while time.time() - timeStart <= display_duration:
-            glClearDepth(1000.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            self.board.draw(mode=3, idx=i)  # mode: 3 for time out
-            pg.display.flip()
+            self.renderer.render(mode=3, idx=i)  # mode: 3 for time out
             time.sleep(1)
             i += 1
         self.done = True
@@ -206,12 +263,15 @@ class Maze3D:
         Displays a starting countdown message to the user before the game starts
         :return: GUI display_duration
         """
+        if self.headless:
+            return 0
         display_duration = self.config['GUI']['start_up_screen_display_duration']
-        self.board.update()
         for i in range(display_duration + 1, -1, -1): # plus 1 for the play screen
-            glClearDepth(1000.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-            self.board.draw(mode=1, idx=i)
-            pg.display.flip()
+            self.renderer.render(mode=1, idx=i)
             time.sleep(1)
         return display_duration
+
+    def close(self):
+        """Closes the game window"""
+        if self.renderer is not None:
+            self.renderer.close()
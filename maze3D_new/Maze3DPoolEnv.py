@@ -0,0 +1,150 @@
+import copy
+import multiprocessing as mp
+import numpy as np
+# Reward functions
+from game import rewards
+# Virtual environment
+from maze3D_new.Maze3DEnv import ActionSpace, Maze3D
+# RL modules
+from plot_utils.plot_utils import get_config
+
+
+class Maze3DPool:
+    """
+    Steps num_envs headless Maze3D games in worker processes, to use every core for collecting rollouts.
+    Each worker plays a slice of the games. The parent writes the actions in shared memory and the workers write the
+    observations, rewards and dones of their games next to them, so only short commands go through the pipes.
+    """
+
+    def __init__(self, num_envs, config=None, config_file=None, num_workers=None):
+        # get the configuration dictionary
+        self.config = get_config(config_file) if config_file is not None else config
+        self.num_envs = num_envs
+        # the workers write the rewards in shared memory, so there must be a reward function
+        reward_type = self.config['SAC']['reward_function'] if 'SAC' in self.config else None
+        if str(reward_type).lower() not in rewards.reward_types:
+            raise ValueError("Maze3DPool needs one of the reward functions {}, not {}".format(rewards.reward_types,
+                                                                                           reward_type))
+        # the workers have no window
+        worker_config = copy.deepcopy(self.config)
+        worker_config['game']['headless'] = True
+
+        # the shared memory of the games, as (ctype, shape) per array
+        self.shared = {'observations': ('d', (num_envs, 8)), 'rewards': ('d', (num_envs,)),
+                       'dones': ('b', (num_envs,)), 'game_ticks': ('q', (num_envs,)),
+                       'actions': ('q', (num_envs,)), 'timed_out': ('b', (num_envs,))}
+        self.shared = {name: (mp.RawArray(ctype, int(np.prod(shape))), ctype, shape)
+                       for name, (ctype, shape) in self.shared.items()}
+        for name, array in shared_arrays(self.shared).items():
+            setattr(self, name, array)
+
+        num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        self.connections, self.workers = [], []
+        for indices in np.array_split(np.arange(num_envs), num_workers):
+            parent_connection, worker_connection = mp.Pipe()
+            process = mp.Process(target=worker, args=(worker_connection, worker_config, indices, self.shared),
+                                 daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(parent_connection)
+            self.workers.append(process)
+
+        # get the action space
+        self.action_space = ActionSpace()
+        # get the shape of the observation space of a single game
+        self.observation_shape = (8,)
+        # the physics ticks per second of the game
+        self.fps = 60
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """
+        Resets the games.
+        :param mask: boolean array of the games to reset. if None all the games are reset
+        :return: the observations of the games
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.run('reset', np.asarray(mask, dtype=bool))
+        return self.observations.copy()
+
+    def step(self, actions, timed_out, goal, action_duration):
+        """
+        Performs the agent's actions on the games that have not finished (see Maze3D.step).
+        :param actions: (num_envs,) array of agent actions
+        :param timed_out: bool or boolean array. true for the games that have been timed out
+        :param goal: the goal of the game
+        :param action_duration: the duration of the actions on the game
+        :return: observations (num_envs, 8), rewards (num_envs,), dones (num_envs,). the finished games get 0 reward
+        """
+        self.actions[:] = actions
+        self.timed_out[:] = timed_out
+        self.run('step', (goal, action_duration))
+        return self.observations.copy(), self.rewards.copy(), self.dones.astype(bool)
+
+    def is_timed_out(self, max_duration):
+        """
+        Checks which games have lasted max_duration, counted in physics ticks.
+        :param max_duration: the max duration of a game in (simulated) sec
+        :return: boolean array. True for the games that have timed out
+        """
+        return self.game_ticks >= max_duration * self.fps
+
+    def run(self, command, args=None):
+        # sends the command to every worker and waits for all of them to finish it
+        for connection in self.connections:
+            connection.send((command, args))
+        for connection in self.connections:
+            connection.recv()
+
+    def close(self):
+        """Stops the worker processes"""
+        if self.workers:
+            self.run('close')
+            for process in self.workers:
+                process.join()
+            self.workers = []
+
+
+def shared_arrays(shared):
+    """
+    :param shared: dictionary of (RawArray, ctype, shape) tuples
+    :return: dictionary of NumPy arrays using the shared memory
+    """
+    return {name: np.frombuffer(raw, dtype=np.dtype(ctype)).reshape(shape) for name, (raw, ctype, shape) in
+            shared.items()}
+
+
+def worker(connection, config, indices, shared):
+    """
+    Plays the games of indices until the close command.
+    :param connection: the pipe to receive the commands from and acknowledge them
+    :param config: the configuration dictionary of the games
+    :param indices: the indices of the games in the shared arrays
+    :param shared: dictionary of (RawArray, ctype, shape) tuples of the shared memory
+    """
+    arrays = shared_arrays(shared)
+    observations, rewards, dones = arrays['observations'], arrays['rewards'], arrays['dones']
+    envs = [Maze3D(config=config) for _ in indices]
+    while True:
+        command, args = connection.recv()
+        if command == 'step':
+            goal, action_duration = args
+            for i, env in zip(indices, envs):
+                if env.done:
+                    rewards[i] = 0
+                    continue
+                observation, reward, done = env.step(int(arrays['actions'][i]), bool(arrays['timed_out'][i]), goal,
+                                                     action_duration)[:3]
+                observations[i], rewards[i], dones[i] = observation, reward, done
+                arrays['game_ticks'][i] = env.game_ticks
+        elif command == 'reset':
+            for i, env in zip(indices, envs):
+                if args[i]:
+                    observations[i] = env.reset(countdown=False)[0]
+                    rewards[i], dones[i], arrays['game_ticks'][i] = 0, False, 0
+        elif command == 'close':
+            connection.send(None)
+            break
+        connection.send(None)
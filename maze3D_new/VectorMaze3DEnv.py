@@ -0,0 +1,207 @@
+import random
+import numpy as np
+# Reward functions
+from game import rewards
+# Virtual environment
+from maze3D_new.gameObjects import GameBoard, ball_diameter, damping_factor
+from maze3D_new.Maze3DEnv import ActionSpace, layouts
+from maze3D_new.utils import goals
+# RL modules
+from plot_utils.plot_utils import get_config
+
+
+class VectorMaze3D:
+    """
+    Steps num_envs Maze3D boards at once (physics only, no rendering).
+    The state of the boards is kept as arrays of length num_envs, one per state variable, and every physics tick of
+    GameBoard.handleKeys and Ball.update is applied to all the boards with NumPy operations.
+    """
+
+    def __init__(self, num_envs, config=None, config_file=None):
+        # get the configuration dictionary
+        self.config = get_config(config_file) if config_file is not None else config
+        self.num_envs = num_envs
+
+        # all the boards play on the same layout
+        current_layout = random.choice(layouts)
+        # get discrete input
+        self.discrete_input = self.config['game']['discrete_input']
+        # check if playing with agent or with 2 humans
+        self.rl = True if 'SAC' in self.config.keys() else False
+        # a single board to read the constants and the starting position of the ball
+        self.board = GameBoard(current_layout, self.discrete_input, self.rl)
+        self.box_size = self.board.box_size
+
+        # ball position and velocity
+        self.x, self.y = np.zeros(num_envs), np.zeros(num_envs)
+        self.vel_x, self.vel_y = np.zeros(num_envs), np.zeros(num_envs)
+        # tray rotation and rotation velocity
+        self.rot_x, self.rot_y = np.zeros(num_envs), np.zeros(num_envs)
+        self.rot_vel_x, self.rot_vel_y = np.zeros(num_envs), np.zeros(num_envs)
+        # boolean that check if each game has finished
+        self.done = np.zeros(num_envs, dtype=bool)
+        # the physics ticks performed in the current game of each board
+        self.game_ticks = np.zeros(num_envs, dtype=np.int64)
+
+        # get the action space
+        self.action_space = ActionSpace()
+        # get the shape of the observation space of a single board
+        self.observation_shape = (8,)
+        # the physics ticks per second of the game
+        self.fps = 60
+        # retrieve the reward
+        rewards.main(self.config)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """
+        Resets the boards.
+        :param mask: boolean array of the boards to reset. if None all the boards are reset
+        :return: the observations of the boards
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        self.x[mask], self.y[mask] = self.board.ball.x, self.board.ball.y
+        self.vel_x[mask], self.vel_y[mask] = 0, 0
+        self.rot_x[mask], self.rot_y[mask] = 0, 0
+        self.rot_vel_x[mask], self.rot_vel_y[mask] = 0, 0
+        self.done[mask] = False
+        self.game_ticks[mask] = 0
+        return self.get_state()
+
+    def step(self, actions, timed_out, goal, action_duration):
+        """
+        Performs the actions on the boards that have not finished for action_duration * fps physics ticks.
+        :param actions: (num_envs, 2) array of actions for the two axes in {-1, 0, 1} (2 stands for -1), or
+        (num_envs,) array of agent actions on the first axis
+        :param timed_out: bool or boolean array. true for the boards that have been timed out
+        :param goal: the goal of the game
+        :param action_duration: the duration of the actions on the game
+        :return: observations (num_envs, 8), rewards (num_envs,), dones (num_envs,). the boards that had already
+        finished get 0 reward
+        """
+        actions = np.asarray(actions)
+        if actions.ndim == 1:
+            actions = np.stack([actions, np.zeros_like(actions)], axis=1)
+        # handleKeys maps 2 to -1
+        actions = np.where(actions == 2, -1, actions)
+        timed_out = np.broadcast_to(np.asarray(timed_out, dtype=bool), (self.num_envs,))
+
+        goal_position = goals[goal]
+        goal_reached = np.zeros(self.num_envs, dtype=bool)
+        finished_before = self.done.copy()
+        for _ in range(int(round(action_duration * self.fps))):
+            active = ~self.done
+            if not active.any():
+                break
+            self.tick(actions, active)
+            self.game_ticks += active
+            goal_reached |= active & (np.hypot(self.x - goal_position[0], self.y - goal_position[1])
+                                      < ball_diameter / 3)
+            # a timed out board finishes after its first tick
+            self.done |= goal_reached | (active & timed_out)
+
+        distance = np.hypot(self.x - goal_position[0], self.y - goal_position[1])
+        # as in Maze3D.step, the reward is computed on whether the game has finished, on this step
+        reward = rewards.reward_function_maze_batch(self.done & ~finished_before, timed_out, distance)
+        reward = np.where(finished_before, 0, reward)
+        return self.get_state(), reward, self.done.copy()
+
+    def is_timed_out(self, max_duration):
+        """
+        Checks which games have lasted max_duration, counted in physics ticks.
+        :param max_duration: the max duration of a game in (simulated) sec
+        :return: boolean array. True for the boards that have timed out
+        """
+        return self.game_ticks >= max_duration * self.fps
+
+    def tick(self, actions, active):
+        """
+        Performs one physics tick on the active boards (GameBoard.handleKeys followed by Ball.update).
+        :param actions: (num_envs, 2) array of actions in {-1, 0, 1}
+        :param active: boolean array of the boards to update
+        """
+        self.handle_keys(actions, active)
+        self.update_balls(active)
+
+    def handle_keys(self, actions, active):
+        board = self.board
+        rot_vel_x = np.where(active, board.scaling_y * actions[:, 0], self.rot_vel_x)
+        rot_x = np.where(active, self.rot_x + rot_vel_x, self.rot_x)
+        limit = active & (np.abs(rot_x) >= board.max_x_rotation)
+        self.rot_x = np.where(limit, np.sign(rot_x) * board.max_x_rotation, rot_x)
+        self.rot_vel_x = np.where(limit, 0, rot_vel_x)
+
+        rot_vel_y = np.where(active, board.scaling_x * actions[:, 1], self.rot_vel_y)
+        rot_y = np.where(active, self.rot_y + rot_vel_y, self.rot_y)
+        limit = active & (np.abs(rot_y) >= board.max_y_rotation)
+        self.rot_y = np.where(limit, np.sign(rot_y) * board.max_y_rotation, rot_y)
+        self.rot_vel_y = np.where(limit, 0, rot_vel_y)
+
+    def update_balls(self, active):
+        vel_x = self.vel_x + 1.5 * -0.1 * self.rot_y
+        vel_y = self.vel_y + 1.5 * 0.1 * self.rot_x
+
+        next_x = self.x + vel_x
+        next_y = self.y + vel_y
+
+        test_next_x = next_x + ball_diameter / 2 * np.sign(vel_x)
+        test_next_y = next_y + ball_diameter / 2 * np.sign(vel_y)
+
+        # bounce on the square walls
+        check_x_col = self.collide_square(test_next_x, self.y)
+        check_y_col = self.collide_square(self.x, test_next_y)
+        vel_x = np.where(check_x_col, np.where(np.abs(vel_x) < 0.1, 0, vel_x * -damping_factor), vel_x)
+        vel_y = np.where(check_y_col, np.where(np.abs(vel_y) < 0.1, 0, vel_y * -damping_factor), vel_y)
+
+        # slide on the diagonal walls
+        vel_x, vel_y = self.slide_on_segments(next_x, next_y, vel_x, vel_y)
+
+        self.vel_x = np.where(active, vel_x, self.vel_x)
+        self.vel_y = np.where(active, vel_y, self.vel_y)
+        self.x = np.where(active, self.x + self.vel_x, self.x)
+        self.y = np.where(active, self.y + self.vel_y, self.y)
+
+    def collide_square(self, x, y):
+        """GameBoard.collideSquare for arrays of positions"""
+        board = self.board
+        row = np.floor((y + board.offset_y) / self.box_size).astype(int)
+        col = np.floor((x + board.offset_x) / self.box_size).astype(int)
+        return board.solid[np.clip(row, 0, board.num_of_boxes_x - 1), np.clip(col, 0, board.num_of_boxes_y - 1)]
+
+    def slide_on_segments(self, next_x, next_y, vel_x, vel_y):
+        """Ball.slide_on_segments for arrays of positions, one nearby segment of every board at a time"""
+        board = self.board
+        row = np.clip(np.floor((next_y + board.offset_y) / self.box_size).astype(int), 0, board.num_of_boxes_x - 1)
+        col = np.clip(np.floor((next_x + board.offset_x) / self.box_size).astype(int), 0, board.num_of_boxes_y - 1)
+        nearby = board.cell_segments[row, col]
+        radius2 = (ball_diameter / 2) ** 2
+        for m in range(nearby.shape[1]):
+            index = nearby[:, m]
+            x1, y1, dx, dy, inv_length2 = board.segment_data[np.maximum(index, 0)].T
+            # closest point of the segment to the ball's next position
+            t = np.clip(((next_x - x1) * dx + (next_y - y1) * dy) * inv_length2, 0, 1)
+            normal_x = next_x - (x1 + t * dx)
+            normal_y = next_y - (y1 + t * dy)
+            distance2 = normal_x * normal_x + normal_y * normal_y
+            touching = (index >= 0) & (distance2 < radius2) & (distance2 > 0)
+            distance = np.sqrt(np.where(touching, distance2, 1))
+            normal_x /= distance
+            normal_y /= distance
+            # velocity towards the wall
+            normal_velocity = vel_x * normal_x + vel_y * normal_y
+            touching &= normal_velocity < 0
+            # stop if slow, else bounce, as with the square walls
+            bounce = np.where(touching, np.where(normal_velocity > -0.1, 1, 1 + damping_factor), 0) * normal_velocity
+            vel_x = vel_x - bounce * normal_x
+            vel_y = vel_y - bounce * normal_y
+        return vel_x, vel_y
+
+    def get_state(self):
+        """
+        ball pos x | ball pos y | ball vel x | ball vel y|  theta(x) | phi(y) |  theta_dot(x) | phi_dot(y)
+        :return: (num_envs, 8) array with the current state of the boards
+        """
+        return np.stack([self.x, self.y, self.vel_x, self.vel_y,
+                         self.rot_x, self.rot_y, self.rot_vel_x, self.rot_vel_y], axis=1)
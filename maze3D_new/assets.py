@@ -1,4 +1,12 @@
 from maze3D_new.config import *
+import glob
+import hashlib
+import os
+
+# the parsed vertices of the .obj files, as .npy files named <hash of the source files>.<vertex format>.npy
+MESH_CACHE_DIR = "maze3D_new/models/cache"
+# the models already uploaded to the GPU by their file path, to share the same mesh
+loaded_models = {}
 
 class Texture:
     def __init__(self,filepath):
@@ -23,33 +31,52 @@ class Texture:
     def getTexture(self):
         return self._tex
 
+def load_model(filepath):
+    # uploads every mesh file once and shares it between the models using it
+    key = os.path.abspath(filepath)
+    if key not in loaded_models:
+        loaded_models[key] = ObjModel(filepath)
+    return loaded_models[key]
+
 class ObjModel:
     def __init__(self,filepath):
+        vertices, vertex_format = read_mesh_cache(filepath)
+        if vertices is None:
+            scene = pwf.Wavefront(filepath)
+            for name, material in scene.materials.items():
+                vertex_format = material.vertex_format
+                vertices = material.vertices
+            vertices = np.array(vertices,dtype=np.float32)
+            write_mesh_cache(filepath,vertices,vertex_format)
 
+        self.upload(vertices,vertex_format)
+
+    def upload(self,vertices,vertex_format):
+        # uploads the interleaved vertices to a VBO and describes their attributes in a VAO
         attributeMap = {'V':0,'T':1,'N':2}
         datatypeMap = {'F':GL_FLOAT}
 
         attributes = []
 
-        scene = pwf.Wavefront(filepath)
-        for name, material in scene.materials.items():
-            vertex_format = material.vertex_format.split("_")
-            vertices = material.vertices
-
         stride = 0
-        for item in vertex_format:
+        for item in vertex_format.split("_"):
             attributeLocation = attributeMap[item[0]]
             attributeStart = stride
             attributeLength = int(item[1])
             attributeDataType = datatypeMap[item[2]]
+            if item[0] == 'V':
+                self._positionStart = attributeStart
             stride += attributeLength
             attributes.append((attributeLocation,attributeLength,attributeDataType,attributeStart*4))
-        
+
+        # kept to bake the model into static geometry
+        self.vertices = vertices
+        self.vertex_format = vertex_format
+        self.stride = stride
+
         self._VAO = glGenVertexArrays(1)
         glBindVertexArray(self._VAO)
 
-        vertices = np.array(vertices,dtype=np.float32)
-
         self._VBO = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER,self._VBO)
         glBufferData(GL_ARRAY_BUFFER,vertices.nbytes,vertices,GL_STATIC_DRAW)
@@ -63,4 +90,68 @@ class ObjModel:
         return self._VAO
 
     def getVertexCount(self):
-        return self._vertexCount
\ No newline at end of file
+        return self._vertexCount
+
+    def translated(self,translation):
+        # a copy of the vertices moved by translation, as a (vertex count, stride) array
+        vertices = self.vertices.reshape(-1,self.stride).copy()
+        vertices[:,self._positionStart:self._positionStart+3] += np.asarray(translation,dtype=np.float32)
+        return vertices
+
+class BakedModel(ObjModel):
+    def __init__(self,groups):
+        """
+        Static geometry: several models, each moved to its position, in one VBO to be drawn with a single model matrix.
+        :param groups: lists of (ObjModel, translation) pairs, e.g. one per texture. the models share a vertex format
+        self.ranges: the (first vertex, vertex count) of every group in the VBO
+        """
+        self.ranges = []
+        parts = []
+        first = 0
+        for group in groups:
+            count = 0
+            for model, translation in group:
+                parts.append(model.translated(translation))
+                count += len(parts[-1])
+            self.ranges.append((first,count))
+            first += count
+
+        vertex_format = groups[0][0][0].vertex_format
+        self.upload(np.concatenate(parts).ravel(),vertex_format)
+
+def mesh_hash(filepath):
+    # hash of the .obj file and the material libraries it uses
+    digest = hashlib.sha1()
+    with open(filepath,'rb') as f:
+        source = f.read()
+    digest.update(source)
+    for line in source.decode(errors='ignore').splitlines():
+        if line.startswith('mtllib'):
+            mtl_path = os.path.join(os.path.dirname(filepath),line.split(None,1)[1].strip())
+            if os.path.exists(mtl_path):
+                with open(mtl_path,'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+def read_mesh_cache(filepath):
+    """
+    :param filepath: the path of a .obj file
+    :return: the cached vertices of the file memory mapped and their vertex format, or None, None if not cached
+    """
+    paths = glob.glob(os.path.join(MESH_CACHE_DIR,mesh_hash(filepath) + '.*.npy'))
+    if not paths:
+        return None, None
+    vertex_format = os.path.basename(paths[0]).split('.')[1]
+    return np.load(paths[0],mmap_mode='r'), vertex_format
+
+def write_mesh_cache(filepath,vertices,vertex_format):
+    try:
+        os.makedirs(MESH_CACHE_DIR,exist_ok=True)
+        path = os.path.join(MESH_CACHE_DIR,'%s.%s.npy' % (mesh_hash(filepath),vertex_format))
+        # write to a temporary file first, so that a concurrent process never reads a partial cache file
+        temporary_path = os.path.join(MESH_CACHE_DIR,'tmp_%d.npy' % os.getpid())
+        np.save(temporary_path,vertices)
+        os.replace(temporary_path,path)
+    except OSError:
+        # the model still loads from the .obj file without the cache
+        pass
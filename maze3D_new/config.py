@@ -78,13 +78,13 @@ glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 glEnable(GL_CULL_FACE)
 
 ########################MODELS######################################
-BOARD_MODEL = ObjModel("maze3D_new/models/board.obj")
-BALL_MODEL = ObjModel("maze3D_new/models/ball_big.obj")
-WALL_MODELS = [ObjModel("maze3D_new/models/wall_tall_big.obj"), ObjModel("maze3D_new/models/wall_half_1_big.obj"),
-				ObjModel("maze3D_new/models/wall_half_2_big.obj"), ObjModel("maze3D_new/models/wall_half_corner_1_bigger_tall.obj"),
-				ObjModel("maze3D_new/models/wall_half_corner_2_bigger_tall.obj")]
-HOLE_MODEL = ObjModel("maze3D_new/models/ball_big.obj")
-TEXT_MODEL = ObjModel("maze3D_new/models/text.obj")
+BOARD_MODEL = load_model("maze3D_new/models/board.obj")
+BALL_MODEL = load_model("maze3D_new/models/ball_big.obj")
+WALL_MODELS = [load_model("maze3D_new/models/wall_tall_big.obj"), load_model("maze3D_new/models/wall_half_1_big.obj"),
+				load_model("maze3D_new/models/wall_half_2_big.obj"), load_model("maze3D_new/models/wall_half_corner_1_bigger_tall.obj"),
+				load_model("maze3D_new/models/wall_half_corner_2_bigger_tall.obj")]
+HOLE_MODEL = load_model("maze3D_new/models/ball_big.obj")
+TEXT_MODEL = load_model("maze3D_new/models/text.obj")
 
 ########################TEXTURES####################################
 BOARD = Texture("maze3D_new/textures/board_white.png")
@@ -127,12 +127,3 @@ glUniform3f(LIGHT_LOC, 0, 0, 300)
 # glUniformMatrix4fv(PROJ_LOC,1,GL_FALSE,projection)
 # glUniformMatrix4fv(VIEW_LOC,1,GL_FALSE,viewMatrix)
 # glUniform3f(LIGHT_LOC,-400.0,200.0,300.0)
-
-center = [0, 0]
-left_down = [-144, -144]
-left_up = [-104, 73]
-right_down = [73, -104]
-
-# #################
-# goal = left_down
-# ################
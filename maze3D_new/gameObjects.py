@@ -1,17 +1,16 @@
-from numpy.linalg import norm
-
-from maze3D_new.config import *
-from maze3D_new.assets import *
 import math
 import numpy as np
-from scipy.spatial import distance
-import time
+import pyrr
+
+from maze3D_new.layouts import diagonal_wall_shapes
+from maze3D_new.physics import ball_diameter, damping_factor, step_ball, step_ball_compiled
 
-ball_diameter = 43.615993
-damping_factor = 0.3
 discrete_steps_from_center = 5
 
 class GameBoard:
+    # the size of the array of cloneState
+    state_size = 8
+
     def __init__(self, layout, discrete=False, rl=False):
         self.box_size = 43.615993
         self.velocity = [0, 0]
@@ -39,6 +38,25 @@ class GameBoard:
                     else:
                         self.walls[row][col] = Wall(self.box_size * col - self.num_of_boxes_y * self.box_size / 2, self.box_size * row - self.num_of_boxes_x * self.box_size / 2, layout[row][col], self)
 
+        # compile the layout once into a grid of the cells the ball cannot enter:
+        # the square walls and the perimeter of the tray
+        self.cells = np.asarray(layout, dtype=np.int8)
+        self.solid = self.cells == 1
+        self.solid[[0, -1], :] = True
+        self.solid[:, [0, -1]] = True
+        # distance of the tray's corner from its center
+        self.offset_x = self.num_of_boxes_y * self.box_size / 2
+        self.offset_y = self.num_of_boxes_x * self.box_size / 2
+        # compile the diagonal walls into line segments, indexed by the cells they are close to
+        self.compileSegments()
+        self.setPhysicsKernel(step_ball_compiled is not None)
+
+        # the walls are static relative to the tray and are drawn baked with the board.
+        # the translations of the ball and the hole on the tray, for their model matrices
+        self.wall_list = [wall for row in self.walls for wall in row if wall is not None]
+        self.translations = np.tile(np.identity(4), (2, 1, 1))
+        self.translations[:, 3, :3] = [[self.ball.x, self.ball.y, self.ball.z], [self.hole.x, self.hole.y, self.hole.z]]
+
         self.rot_x = 0
         self.rot_y = 0
         self.count_slide = 0
@@ -50,40 +68,138 @@ class GameBoard:
                        4: (0, 1), 5: (1, 1), 6: (-1, 1), 7: (0, 1),
                        8: (0, -1), 9: (1, -1), 10: (-1, -1), 11: (0, -1), 13: (1, 0), 14: (-1, 0)}
 
+        # the starting state of the board, to reset it
+        self.initial_state = self.cloneState()
+
+    def reset(self):
+        # puts the ball back to its starting position and levels the tray, as in a new board of the same layout
+        self.restoreState(self.initial_state)
+
+    def cloneState(self, out=None):
+        """
+        :param out: an array of size state_size to store the state in, instead of allocating a new one
+        :return: the state of the board: ball pos x | ball pos y | ball vel x | ball vel y | theta(x) | phi(y) |
+        theta_dot(x) | phi_dot(y)
+        """
+        if out is None:
+            out = np.empty(self.state_size)
+        out[:] = (self.ball.x, self.ball.y, self.ball.velocity[0], self.ball.velocity[1],
+                  self.rot_x, self.rot_y, self.velocity[0], self.velocity[1])
+        return out
+
+    def restoreState(self, state):
+        """
+        Sets the state of the board.
+        :param state: an array of size state_size from cloneState
+        """
+        # python floats are faster than numpy scalars in the physics
+        (self.ball.x, self.ball.y, self.ball.velocity[0], self.ball.velocity[1],
+         self.rot_x, self.rot_y, self.velocity[0], self.velocity[1]) = np.asarray(state, dtype=np.float64).tolist()
+
     def getBallCoords(self):
         return (self.ball.x, self.ball.y)
 
-    def collideSquare(self, x, y):
-        # if the ball hits a square obstacle, it will return True
-        # and the collideTriangle will not be called
-
-        xGrid = math.floor((x + self.num_of_boxes_x * self.box_size / 2) / self.box_size)
-        yGrid = math.floor((y + self.num_of_boxes_y * self.box_size / 2) / self.box_size)
-
-        biggest = max(xGrid, yGrid)
-        smallest = min(xGrid, yGrid)
-        # check the perimeter walls of the tray
-        if biggest > 13 or smallest < 1:
-            return True, None
-        # checks collisons with corner blocks
-        if self.walls[yGrid][xGrid] is not None and self.layout[yGrid][xGrid] == 1:
-            return True, self.layout[yGrid][xGrid]
-        return False, None
+    def compileSegments(self):
+        """
+        Converts the exposed edges of the diagonal wall cells of the layout into line segments.
+        self.segments: (K, 4) array of the segments' end points x1, y1, x2, y2
+        self.cell_segments: (rows, cols, M) array of the indices of the segments that a ball centered in each cell
+        can touch, padded with -1
+        self.segment_data: (K, 5) array of x1, y1, x2 - x1, y2 - y1, 1 / length^2 of the segments, used by the physics
+        """
+        # count the edges of the polygons in grid units. the edges shared by two polygons are inside the walls
+        edges = {}
+        for row in range(self.num_of_boxes_x):
+            for col in range(self.num_of_boxes_y):
+                shape = diagonal_wall_shapes.get(self.layout[row][col])
+                if shape is None:
+                    continue
+                corners = [(col + u, row + v) for u, v in shape]
+                for start, end in zip(corners, corners[1:] + corners[:1]):
+                    key = (min(start, end), max(start, end))
+                    edges[key] = edges.get(key, 0) + 1
+
+        segments = []
+        for (start, end), count in edges.items():
+            if count > 1 or self.edgeOnSolid(start, end):
+                continue
+            segments.append([self.box_size * start[0] - self.offset_x, self.box_size * start[1] - self.offset_y,
+                             self.box_size * end[0] - self.offset_x, self.box_size * end[1] - self.offset_y])
+        self.segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        deltas = self.segments[:, 2:] - self.segments[:, :2]
+        self.segment_data = np.column_stack([self.segments[:, :2], deltas, 1 / (deltas ** 2).sum(axis=1)])
+
+        # a ball in a cell can only touch the segments within a radius from the cell
+        radius = ball_diameter / 2
+        cells = [[[] for _ in range(self.num_of_boxes_y)] for _ in range(self.num_of_boxes_x)]
+        for i, (x1, y1, x2, y2) in enumerate(self.segments):
+            row_min, col_min = self.getCell(min(x1, x2) - radius, min(y1, y2) - radius)
+            row_max, col_max = self.getCell(max(x1, x2) + radius, max(y1, y2) + radius)
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    cells[row][col].append(i)
+
+        max_segments = max([len(indices) for row in cells for indices in row] + [1])
+        self.cell_segments = np.full((self.num_of_boxes_x, self.num_of_boxes_y, max_segments), -1, dtype=np.int64)
+        for row in range(self.num_of_boxes_x):
+            for col in range(self.num_of_boxes_y):
+                indices = cells[row][col]
+                self.cell_segments[row, col, :len(indices)] = indices
+
+    def setPhysicsKernel(self, compiled):
+        """
+        Selects the physics kernel of the ball and the compiled layout it runs on.
+        :param compiled: True for the numba compiled kernel, False for the pure python one
+        """
+        if compiled:
+            self.stepBall = step_ball_compiled
+            self.physicsLayout = (self.solid, self.cell_segments, self.segment_data)
+        else:
+            # nested lists are faster than arrays to index from python
+            self.stepBall = step_ball
+            self.physicsLayout = (self.solid.tolist(), self.cell_segments.tolist(), self.segment_data.tolist())
+
+    def edgeOnSolid(self, start, end):
+        # True if an axis aligned edge (in grid units) borders a square wall or the perimeter of the tray,
+        # which collideSquare already handles
+        (col1, row1), (col2, row2) = start, end
+        if row1 == row2:
+            neighbours = [(row1 - 1, min(col1, col2)), (row1, min(col1, col2))]
+        elif col1 == col2:
+            neighbours = [(min(row1, row2), col1 - 1), (min(row1, row2), col1)]
+        else:
+            return False
+        for row, col in neighbours:
+            if not (0 <= row < self.num_of_boxes_x and 0 <= col < self.num_of_boxes_y) or self.solid[row, col]:
+                return True
+        return False
+
+    def getCell(self, x, y):
+        # the (row, col) of the grid cell containing the point (x, y). points off the tray map to its perimeter
+        row = math.floor((y + self.offset_y) / self.box_size)
+        col = math.floor((x + self.offset_x) / self.box_size)
+        return min(max(row, 0), self.num_of_boxes_x - 1), min(max(col, 0), self.num_of_boxes_y - 1)
 
+    def collideSquare(self, x, y):
+        # if the point (x, y) is in a square obstacle or the perimeter walls of the tray, it will return True
+        return self.solid[self.getCell(x, y)]
 
     def update(self):
+        self.ball.update()
+
+    def computeModels(self):
+        """
+        Computes the rotation matrix of the tray and the model matrices of the ball and the hole, in one batch.
+        Only needed when a frame is drawn.
+        """
         # compute rotation matrix
         rot_x_m = pyrr.Matrix44.from_x_rotation(self.rot_x)
         rot_y_m = pyrr.Matrix44.from_y_rotation(self.rot_y)
         self.rotationMatrix = pyrr.matrix44.multiply(rot_x_m, rot_y_m)
 
-        self.ball.update()
-        self.hole.update()
-
-        for row in self.walls:
-            for wall in row:
-                if wall != None:
-                    wall.update()
+        # first translate to position on board, then rotate with the board
+        self.translations[0, 3, :2] = self.ball.x, self.ball.y
+        self.ball.model, self.hole.model = np.matmul(self.translations, self.rotationMatrix)
 
     def handleKeys(self, angleIncrement):
         if angleIncrement[0] == 2:
@@ -114,46 +230,6 @@ class GameBoard:
             self.rot_y = -self.max_y_rotation
             self.velocity[1] = 0
 
-    def draw(self, mode=0, idx=0):
-        translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([-80, -80, 0]))
-        self.model = pyrr.matrix44.multiply(translation, self.rotationMatrix)
-        glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, self.model)
-        glBindVertexArray(BOARD_MODEL.getVAO())
-        glBindTexture(GL_TEXTURE_2D, BOARD.getTexture())
-        glDrawArrays(GL_TRIANGLES, 0, BOARD_MODEL.getVertexCount())
-
-        self.ball.draw()
-        self.hole.draw()
-
-        for row in self.walls:
-            for wall in row:
-                if wall != None:
-                    wall.draw()
-        # Used for resetting the game. Logs above the board "Game starts in ..."
-        if mode == 1:
-            translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([-60, 350, 0]))
-            glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE,
-                               pyrr.matrix44.multiply(translation, pyrr.matrix44.create_identity()))
-            glBindVertexArray(TEXT_MODEL.getVAO())
-            glBindTexture(GL_TEXTURE_2D, TEXT[idx].getTexture())
-            glDrawArrays(GL_TRIANGLES, 0, TEXT_MODEL.getVertexCount())
-        # Used when goal has been reached. Logs above the board "Goal reached"
-        elif mode == 2:
-            translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([-60, 350, 0]))
-            glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE,
-                               pyrr.matrix44.multiply(translation, pyrr.matrix44.create_identity()))
-            glBindVertexArray(TEXT_MODEL.getVAO())
-            glBindTexture(GL_TEXTURE_2D, TEXT[-2].getTexture())
-            glDrawArrays(GL_TRIANGLES, 0, TEXT_MODEL.getVertexCount())
-        # Used for resetting the game. Logs above the board "Timeout"
-        elif mode == 3:
-            translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([-60, 350, 0]))
-            glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE,
-                               pyrr.matrix44.multiply(translation, pyrr.matrix44.create_identity()))
-            glBindVertexArray(TEXT_MODEL.getVAO())
-            glBindTexture(GL_TEXTURE_2D, TEXT[-1].getTexture())
-            glDrawArrays(GL_TRIANGLES, 0, TEXT_MODEL.getVertexCount())
-
 
 class Wall:
     def __init__(self, x, y, type, parent):
@@ -165,30 +241,10 @@ class Wall:
             type = 1
         self.type = type - 1
 
-    def update(self):
-        # first translate to position on board, then rotate with the board
-        translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([self.x, self.y, self.z]))
-        self.model = pyrr.matrix44.multiply(translation, self.parent.rotationMatrix)
-
-    def draw(self):
-        glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, self.model)
-        glBindVertexArray(WALL_MODELS[self.type].getVAO())
-        glBindTexture(GL_TEXTURE_2D, WALL.getTexture())
-        glDrawArrays(GL_TRIANGLES, 0, WALL_MODELS[self.type].getVertexCount())
-
-
-def compute_angle(nextX, nextY):
-    if nextX >= 0:
-        return np.arctan(nextY / nextX) * 180 / np.pi
-    else:
-        return 180 + np.arctan(nextY / nextX) * 180 / np.pi
-
-
-def distance_from_line(p2, p1, p0):
-    return  norm(np.cross(p2 - p1, p1 - p0)) / norm(p2 - p1)
-
 
 class Ball:
+    __slots__ = ['exception', 'parent', 'x', 'y', 'z', 'velocity', 'box_size', 'model']
+
     def __init__(self, x, y, parent):
         self.exception = True
         self.parent = parent
@@ -199,216 +255,10 @@ class Ball:
         self.box_size = 43.615993
 
     def update(self):
-        # first translate to position on board, then rotate with the board
-        translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([self.x, self.y, self.z]))
-        self.model = pyrr.matrix44.multiply(translation, self.parent.rotationMatrix)
-
-        # print([self.x, self.y])
-        acceleration = [-0.1 * self.parent.rot_y, 0.1 * self.parent.rot_x]
-        self.velocity[0] += 1.5 * acceleration[0]
-        self.velocity[1] += 1.5 * acceleration[1]
-
-        nextX = self.x + self.velocity[0]
-        nextY = self.y + self.velocity[1]
-
-        test_nextX = nextX + ball_diameter / 2 * np.sign(self.velocity[0])
-        test_nextY = nextY + ball_diameter / 2 * np.sign(self.velocity[1])
-
-        # check x direction
-        checkXCol, gridX = self.parent.collideSquare(test_nextX, self.y)
-        checkYCol, gridY = self.parent.collideSquare(self.x, test_nextY)
-
-        if checkXCol:
-            if abs(self.velocity[0]) < 0.1:
-                self.velocity[0] = 0
-            else:
-                self.velocity[0] *= -damping_factor
-
-        # check y direction
-        if checkYCol:
-            if abs(self.velocity[1]) < 0.1:
-                self.velocity[1] = 0
-            else:
-                self.velocity[1] *= -damping_factor
-
-        angle_from_center = compute_angle(nextX, nextY)
-
-        # check if in the upper diagonal barrier
-        if -45 <= angle_from_center <= 135:
-            # if ball is in the upper triangle of the tray
-            self.slide_on_upper_triangle(nextX, nextY, angle_from_center)
-        elif 135 < angle_from_center <= 180 or angle_from_center <= -45:
-            self.slide_on_lower_triangle(nextX, nextY, angle_from_center)
-
-        self.x += self.velocity[0]
-        self.y += self.velocity[1]
-
-    def draw(self):
-        glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, self.model)
-        glBindVertexArray(BALL_MODEL.getVAO())
-        glBindTexture(GL_TEXTURE_2D, BALL.getTexture())
-        glDrawArrays(GL_TRIANGLES, 0, BALL_MODEL.getVertexCount())
-
-    def slide_on_upper_triangle(self, nextX, nextY, theta):
-        # distance of a point (ball's edge towards the move direction) from a line
-        p1 = np.asarray([0, self.box_size])
-        p2 = np.asarray([self.box_size, 0])
-        d = norm(np.cross(p2 - p1, p1 - [nextX, nextY])) / norm(p2 - p1)
-
-        if d <= (ball_diameter / 2):
-            # check if there is an opening
-            # print([test_nextX, test_nextY])
-            if self.velocity[0] > 0 and self.velocity[1] < 0 and theta >= 90:
-                if (nextX - ball_diameter/3) > -self.box_size/2:
-                    self.velocity *= 1
-                    return
-                elif (nextX - ball_diameter/2) < -self.box_size/2 and nextY - ball_diameter/2 <= self.box_size*1.5:
-                    self.velocity *= 1                                                   
-                    return
-            if -self.box_size/2 <= nextX - ball_diameter/2 and -self.box_size/2 <= nextY - ball_diameter/2:
-                pass
-            # block 2
-            elif nextX - ball_diameter/2 <= self.box_size*1.5 and (nextY - ball_diameter/2) < -self.box_size/2:
-                if self.velocity[1] < 0:
-                    # keep going on the y axis
-                    self.velocity[1] *= - damping_factor
-                    # bounce on the x axis
-                    self.velocity[0] = self.velocity[0] + self.velocity[1] * np.sin(theta * np.pi / 180)
-            # block 1
-            elif (nextX - ball_diameter/2) < -ball_diameter/2 and nextY - ball_diameter/2 <= 48:
-                if self.velocity[0] < 0 and self.velocity[1] >= 0:
-                    # bounce on the x axis
-                    self.velocity[0] *= -1 * damping_factor
-                    # keep going on the y axis
-                    self.velocity[1] = self.velocity[1] + self.velocity[0] * np.sin(theta * np.pi / 180)
-                elif self.velocity[0] < 0 and self.velocity[1] < 0:
-                    # bounce on the x axis
-                    self.velocity[0] *= -1 * damping_factor
-                    # keep going on the y axis
-                    self.velocity[1] = self.velocity[1] + self.velocity[0] * np.sin(theta * np.pi / 180)
-            # elif self.velocity[0] < 0 and self.velocity[1] > 0 and theta >= 90 and (nextX - ball_diameter/2) < -16 and nextY < 48:
-            #         self.velocity[0] = 0.4 * self.velocity[0] + self.velocity[1] * np.cos((-theta) * np.pi / 180)
-            #         self.velocity[1] *= np.cos(theta * np.pi / 180) * np.sin((90 - theta) * np.pi / 180)
-            else:
-                if self.velocity[0] > 0 and self.velocity[1] < 0:
-                    # bounce on the x axis
-                    if theta > 90:
-                        self.velocity[0] = 0.4 * self.velocity[0] + self.velocity[1] * np.cos((-theta) * np.pi / 180)
-                        self.velocity[1] *= np.cos(theta * np.pi / 180) * np.sin((90-theta) * np.pi / 180)
-
-                    else:
-                        self.velocity[1] *= np.cos(-theta * np.pi / 180) * np.sin((-theta) * np.pi / 180)
-                        self.velocity[0] = self.velocity[0] + self.velocity[1] * np.sin((-90+theta) * np.pi / 180)
-                        # keep going on the y axis
-                # go to down right
-                elif self.velocity[0] <= 0 and self.velocity[1] <= 0:
-                    if theta > 90 and norm(self.velocity) <= 1.5:
-                        self.velocity[0] = self.velocity[1] * np.cos((theta) * np.pi / 180)
-                        self.velocity[1] * np.sin(theta * np.pi / 180)
-                    elif theta < 0 and norm(self.velocity) <= 1.5:
-                        self.velocity[0] = self.velocity[1] * np.cos((180-theta) * np.pi / 180)
-                        self.velocity[1] *= np.sin((-theta) * np.pi / 180)
-                    else:
-                        # keep going on the x axis
-                        self.velocity[0] *= -damping_factor
-                        # bounce on the y axis
-                        self.velocity[1] *= -damping_factor
-                # go up
-                elif self.velocity[0] <= 0 and self.velocity[1] >= 0:
-                    if theta >= 0:
-                        # keep going on the x axis
-                        self.velocity[0] *= np.sin((90-theta) * np.pi / 180) * np.cos((theta) * np.pi / 180)
-                        # bounce on the y axis
-                        self.velocity[1] = self.velocity[1] + self.velocity[0] * np.cos(theta * np.pi / 180)
-                    else:
-                        # keep going on the x axis
-                        self.velocity[0] *= np.sin((theta) * np.pi / 180) * np.cos((90-theta) * np.pi / 180)
-                        # bounce on the y axis
-                        self.velocity[1] = self.velocity[1] + self.velocity[0] * np.cos(
-                            90-theta * np.pi / 180)
-
-    def slide_on_lower_triangle(self, nextX, nextY, theta):
-        # define the line that the ball must not pass to insert in the frontier
-        p1, p2 = np.asarray([0, -self.box_size]), np.asarray([-self.box_size, 0])
-        # distance of a point (ball's edge towards the move direction) from a line
-        d = distance_from_line(p2, p1, [nextX, nextY])
-
-        # check if the ball's next center position closer than the ball's radius to the frontier line
-        if d <= ball_diameter / 2:
-            # check if there is an opening
-            # print([test_nextX, test_nextY])
-            if self.velocity[0] > 0 and self.velocity[1] < 0 and theta >= 180:
-                if (nextX + ball_diameter/3) > self.box_size/2:
-                    self.velocity *= 1
-                    return
-                elif (nextX + ball_diameter/2) > self.box_size/2 and nextY - ball_diameter/2 <= 0:
-                    self.velocity *= 1
-                    return
-            if nextX + ball_diameter/2 <= self.box_size/2 and nextY + ball_diameter/2 <= self.box_size/2:
-                pass
-            # block 2
-            elif self.box_size/2 < nextX + ball_diameter/2 and -self.box_size*1.5 <= nextY + ball_diameter/2:
-                if self.velocity[0] > 0:
-                    # # bounce on the x axis
-                    # self.velocity[0] *= -1 * damping_factor
-                    # # keep going on the y axis
-                    # self.velocity[1] *= damping_factor
-                    # bounce on the x axis
-                    self.velocity[0] *= -1 * damping_factor
-                     # keep going on the y axis
-                    self.velocity[1] = self.velocity[1] + self.velocity[0] * np.cos(theta * np.pi / 180)
-            # block 1
-            elif -self.box_size*1.5 <= nextX + ball_diameter/2 and self.box_size/2 < nextY + ball_diameter/2:
-                if self.velocity[1] > 0:
-                    # # bounce on the x axis
-                    # self.velocity[0] *= damping_factor
-                    # # keep going on the y axis
-                    # self.velocity[1] *= -damping_factor
-                    # bounce on the x axis
-                    self.velocity[1] *= -1 * damping_factor
-                    self.velocity[0] = self.velocity[0] + self.velocity[1] * np.cos((180-theta) * np.pi / 180)
-                    # keep going on the y axis
-
-            else:
-                if self.velocity[0] < 0 and self.velocity[1] > 0:
-                    if theta < -45:
-                        # bounce on the y axis
-                        self.velocity[1] *= np.sin(-theta * np.pi / 180) * np.cos((theta) * np.pi / 180)
-                        self.velocity[0] = self.velocity[0] + self.velocity[1] * np.sin(-90-theta * np.pi / 180)
-                    else:
-                        # bounce on the y axis
-                        self.velocity[1] *= np.sin(theta * np.pi / 180) * np.cos((180-theta) * np.pi / 180)
-                        self.velocity[0] = self.velocity[0] + self.velocity[1] * np.cos(-theta * np.pi / 180)
-
-                # go to down right
-                elif self.velocity[0] >= 0 and self.velocity[1] >= 0:
-                    # keep going on the x axis
-                    # self.velocity[0] *= -damping_factor
-                    # # bounce on the y axis
-                    # self.velocity[1] *= damping_factor
-                    # bounce on the y axis
-                    # keep going on the x axis
-                    if theta <= -45 and norm(self.velocity) <= 1.5:
-                        self.velocity[0] = self.velocity[1] * np.cos((theta) * np.pi / 180)
-                        self.velocity[1] *= np.sin((-theta) * np.pi / 180)
-                    if theta <= 180 and norm(self.velocity) <= 1.5:
-                        self.velocity[1] = self.velocity[0] * np.cos((theta) * np.pi / 180)
-                        self.velocity[0] *= np.sin((theta) * np.pi / 180)
-                    else:
-                        self.velocity[0] *= - damping_factor
-                        # bounce on the y axis
-                        self.velocity[1] *= damping_factor
-                # go up
-                elif self.velocity[0] >= 0 and self.velocity[1] <= 0:
-                    if theta < -45:
-                        self.velocity[0] *= np.sin((90 - theta) * np.pi / 180) * np.cos((theta) * np.pi / 180)
-                        self.velocity[1] = self.velocity[1] + self.velocity[0] * np.sin(
-                            theta * np.pi / 180)
-                    else:
-                        # bounce on the y axis
-                        self.velocity[1] = self.velocity[0] * np.cos(theta * np.pi / 180)
-                        # keep going on the x axis
-                        self.velocity[0] *= np.sin(theta * np.pi / 180)
+        board = self.parent
+        self.x, self.y, self.velocity[0], self.velocity[1] = board.stepBall(
+            self.x, self.y, self.velocity[0], self.velocity[1], board.rot_x, board.rot_y, *board.physicsLayout,
+            board.offset_x, board.offset_y, board.box_size)
 
 
 class Hole:
@@ -417,14 +267,3 @@ class Hole:
         self.x = x
         self.y = y
         self.z = 0
-
-    def update(self):
-        # first translate to position on board, then rotate with the board
-        translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([self.x, self.y, self.z]))
-        self.model = pyrr.matrix44.multiply(translation, self.parent.rotationMatrix)
-
-    def draw(self):
-        glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, self.model)
-        glBindVertexArray(HOLE_MODEL.getVAO())
-        glBindTexture(GL_TEXTURE_2D, HOLE.getTexture())
-        glDrawArrays(GL_TRIANGLES, 0, HOLE_MODEL.getVertexCount())
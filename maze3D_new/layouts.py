@@ -120,4 +120,17 @@ layout_10_up_right = [
     [1, 1, 6, 4, 0, 0, 0, 0, 0, 0, 1],
     [1, 1, 1, 0, 0, 0, 0, 0, 0, 3, 1],
     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
-]
\ No newline at end of file
+]
+
+# goal positions on the board
+center = [0, 0]
+left_down = [-144, -144]
+left_up = [-104, 73]
+right_down = [73, -104]
+
+# the solid part of the diagonal wall cells, as polygons in cell units from the corner of the cell
+# 4: lower left half, 5: upper right half, 6 and 7: whole cell
+diagonal_wall_shapes = {4: [(0, 0), (1, 0), (0, 1)],
+                        5: [(1, 0), (1, 1), (0, 1)],
+                        6: [(0, 0), (1, 0), (1, 1), (0, 1)],
+                        7: [(0, 0), (1, 0), (1, 1), (0, 1)]}
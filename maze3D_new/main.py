@@ -1,6 +1,7 @@
-from config import *
-from gameObjects import *
-from assets import *
+# run from the repository's root: python -m maze3D_new.main
+from maze3D_new.renderer import *
+from maze3D_new.gameObjects import *
+from scipy.spatial import distance
 import time
 
 # current layout
@@ -23,6 +24,7 @@ layout = [
 ]
 
 board = GameBoard(layout)
+renderer = Renderer(board)
 keys = {pg.K_UP:1,pg.K_DOWN:2,pg.K_LEFT:4,pg.K_RIGHT:8}
 currentKey = 0
 running = True
@@ -43,15 +45,8 @@ while running:
 
     board.handleKeys(currentKey)
     board.update()
-    glClearDepth(1000.0)
-    glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
-    board.draw()
-    ballCoords = board.getBallCoords()
-    pg.draw.line(screen, (255, 255, 255), (0,0), ballCoords)
-    pg.display.flip()
-    clock.tick()
-    fps = clock.get_fps()
-    pg.display.set_caption("Running at "+str(int(fps))+" fps")
+    renderer.render()
+    renderer.tick(0)
 
     # if train_game_number has ended (goal reached), then reset the board and wait 5 secs to start the next train_game_number
     # while logging the countdown
@@ -61,10 +56,8 @@ while running:
         while time.time() - timeStart <= 5:
             board = GameBoard(layout)
             board.update()
-            glClearDepth(1000.0)
-            glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
-            board.draw(mode=True, idx=i)
-            pg.display.flip()
+            renderer.set_board(board)
+            renderer.render(mode=1, idx=i)
             time.sleep(1)
             i+=1
 
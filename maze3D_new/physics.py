@@ -0,0 +1,93 @@
+"""
+The physics of the ball as a plain float kernel, so that a tick does not pay the overhead of NumPy on scalars.
+If numba is installed, the same kernel is also compiled to machine code (step_ball_compiled).
+"""
+import math
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+ball_diameter = 43.615993
+damping_factor = 0.3
+
+
+def step_ball(x, y, vel_x, vel_y, rot_x, rot_y, solid, cell_segments, segments, offset_x, offset_y, box_size):
+    """
+    Moves the ball for one tick on the tilted tray.
+    :param x, y, vel_x, vel_y: the position and velocity of the ball
+    :param rot_x, rot_y: the rotation of the tray
+    :param solid, cell_segments, segments: GameBoard.solid, GameBoard.cell_segments and GameBoard.segment_data,
+    as arrays or nested lists
+    :param offset_x, offset_y: the distance of the tray's corner from its center
+    :param box_size: the size of a grid cell
+    :return: the new x, y, vel_x, vel_y
+    """
+    last_row = len(solid) - 1
+    last_col = len(solid[0]) - 1
+    radius = ball_diameter / 2
+
+    vel_x += 1.5 * (-0.1 * rot_y)
+    vel_y += 1.5 * (0.1 * rot_x)
+
+    next_x = x + vel_x
+    next_y = y + vel_y
+
+    # the point of the ball in the direction of its velocity
+    test_next_x = next_x + (radius if vel_x > 0 else -radius if vel_x < 0 else 0.0)
+    test_next_y = next_y + (radius if vel_y > 0 else -radius if vel_y < 0 else 0.0)
+
+    # bounce on the square walls
+    row = min(max(math.floor((y + offset_y) / box_size), 0), last_row)
+    col = min(max(math.floor((test_next_x + offset_x) / box_size), 0), last_col)
+    check_x_col = solid[row][col]
+    row = min(max(math.floor((test_next_y + offset_y) / box_size), 0), last_row)
+    col = min(max(math.floor((x + offset_x) / box_size), 0), last_col)
+    check_y_col = solid[row][col]
+
+    if check_x_col:
+        if abs(vel_x) < 0.1:
+            vel_x = 0.0
+        else:
+            vel_x *= -damping_factor
+    if check_y_col:
+        if abs(vel_y) < 0.1:
+            vel_y = 0.0
+        else:
+            vel_y *= -damping_factor
+
+    # slide on the diagonal walls close to the ball's next position
+    row = min(max(math.floor((next_y + offset_y) / box_size), 0), last_row)
+    col = min(max(math.floor((next_x + offset_x) / box_size), 0), last_col)
+    nearby = cell_segments[row][col]
+    for m in range(len(nearby)):
+        i = nearby[m]
+        if i < 0:
+            break
+        segment = segments[i]
+        x1, y1, dx, dy = segment[0], segment[1], segment[2], segment[3]
+        # closest point of the segment to the ball's next position
+        t = ((next_x - x1) * dx + (next_y - y1) * dy) * segment[4]
+        t = 0.0 if t < 0 else 1.0 if t > 1 else t
+        normal_x = next_x - (x1 + t * dx)
+        normal_y = next_y - (y1 + t * dy)
+        distance2 = normal_x * normal_x + normal_y * normal_y
+        if distance2 >= radius * radius or distance2 == 0:
+            continue
+        distance = math.sqrt(distance2)
+        normal_x /= distance
+        normal_y /= distance
+        # velocity towards the wall
+        normal_velocity = vel_x * normal_x + vel_y * normal_y
+        if normal_velocity >= 0:
+            continue
+        # stop if slow, else bounce, as with the square walls
+        bounce = 1.0 if normal_velocity > -0.1 else 1 + damping_factor
+        vel_x -= bounce * normal_velocity * normal_x
+        vel_y -= bounce * normal_velocity * normal_y
+
+    return x + vel_x, y + vel_y, vel_x, vel_y
+
+
+step_ball_compiled = njit(cache=True)(step_ball) if njit is not None else None
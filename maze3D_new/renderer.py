@@ -0,0 +1,134 @@
+# Importing this module opens the game window, compiles the shaders and loads the models and textures
+from maze3D_new.assets import *
+
+# the static geometry of every layout played: the board and the walls, baked once in the coordinates of the tray
+baked_mazes = {}
+
+
+class Renderer:
+    """Draws a GameBoard on the game window and reads the keyboard input of the user"""
+
+    def __init__(self, board):
+        self.board = board
+        self.maze = bake_maze(board)
+        # create the key dictionary
+        self.keys = {pg.K_UP: 1, pg.K_DOWN: 2, pg.K_LEFT: 4, pg.K_RIGHT: 8}
+        # create conversion key dictionary
+        self.conversion_keys = {pg.K_UP: 0, pg.K_DOWN: 1, pg.K_LEFT: 2, pg.K_RIGHT: 3}
+
+    def set_board(self, board):
+        # draws a new board from now on
+        self.board = board
+        self.maze = bake_maze(board)
+
+    def render(self, mode=0, idx=0):
+        """
+        Clears the window, draws the board and flips the display.
+        :param mode: 0 for the game, 1 for the starting countdown, 2 for reaching the goal, 3 for time out
+        :param idx: the index of the countdown text to display
+        """
+        glClearDepth(1000.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        self.draw(mode, idx)
+        pg.display.flip()
+
+    def tick(self, fps):
+        """
+        Waits for the next frame.
+        :param fps: the fps to run the game in
+        :return: the actual fps performed
+        """
+        clock.tick(fps)  # set the fps tick
+        actual_fps = clock.get_fps()  # get the actual fps performed
+        pg.display.set_caption("Running at " + str(int(actual_fps)) + " fps")
+        return actual_fps
+
+    def draw(self, mode=0, idx=0):
+        board = self.board
+        # the model matrices are only computed for the frames that are drawn
+        board.computeModels()
+        # the board and the walls rotate with the tray
+        draw_baked_model(board.rotationMatrix, self.maze, [BOARD, WALL])
+
+        draw_model(board.ball.model, BALL_MODEL, BALL)
+        draw_model(board.hole.model, HOLE_MODEL, HOLE)
+        # Used for resetting the game. Logs above the board "Game starts in ..."
+        if mode == 1:
+            draw_text(TEXT[idx])
+        # Used when goal has been reached. Logs above the board "Goal reached"
+        elif mode == 2:
+            draw_text(TEXT[-2])
+        # Used for resetting the game. Logs above the board "Timeout"
+        elif mode == 3:
+            draw_text(TEXT[-1])
+
+    def get_keyboard(self, actions, discrete_input):
+        """
+        Retrieves human's action from keyboard arrows.
+        -left/right
+        -space: pause (press again to unpause)
+        - up/down if applicable (in 2 humans set up)
+        :param actions: an action vector used to convert actions
+        :param discrete_input: True if every keystroke produces one action
+        :return: duration_pause, action vector
+        """
+        duration_pause = 0
+        if not discrete_input:
+            pg.key.set_repeat(10)  # argument states the difference (in ms) between consecutive press events
+        space_pressed = True
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                return 1
+            if event.type == pg.KEYDOWN:
+                if event.key == pg.K_SPACE and space_pressed:
+                    space_pressed = False
+                    start_pause = time.time()
+                    pause()
+                    end_pause = time.time()
+                    duration_pause += end_pause - start_pause
+                if event.key == pg.K_q:
+                    exit(1)
+                if event.key in self.keys:
+                    actions[self.conversion_keys[event.key]] = 1
+                    # action_human += maze.keys[event.key]
+            if event.type == pg.KEYUP:
+                if event.key in self.keys:
+                    actions[self.conversion_keys[event.key]] = 0
+                    # action_human -= maze.keys[event.key]
+        return duration_pause, actions
+
+    def close(self):
+        pg.quit()
+
+
+def bake_maze(board):
+    """
+    :param board: a GameBoard
+    :return: the BakedModel of the board (first group) and the walls (second group) of the board's layout
+    """
+    key = tuple(map(tuple, board.layout))
+    if key not in baked_mazes:
+        walls = [(WALL_MODELS[wall.type], (wall.x, wall.y, wall.z)) for wall in board.wall_list]
+        baked_mazes[key] = BakedModel([[(BOARD_MODEL, (-80, -80, 0))], walls])
+    return baked_mazes[key]
+
+
+def draw_baked_model(model, baked_model, textures):
+    # one draw call per group of the baked model, with the same model matrix
+    glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, model)
+    glBindVertexArray(baked_model.getVAO())
+    for texture, (first, count) in zip(textures, baked_model.ranges):
+        glBindTexture(GL_TEXTURE_2D, texture.getTexture())
+        glDrawArrays(GL_TRIANGLES, first, count)
+
+
+def draw_model(model, obj_model, texture):
+    glUniformMatrix4fv(MODEL_LOC, 1, GL_FALSE, model)
+    glBindVertexArray(obj_model.getVAO())
+    glBindTexture(GL_TEXTURE_2D, texture.getTexture())
+    glDrawArrays(GL_TRIANGLES, 0, obj_model.getVertexCount())
+
+
+def draw_text(texture):
+    translation = pyrr.matrix44.create_from_translation(pyrr.Vector3([-60, 350, 0]))
+    draw_model(pyrr.matrix44.multiply(translation, pyrr.matrix44.create_identity()), TEXT_MODEL, texture)
@@ -2,7 +2,7 @@ import math
 import numpy as np
 from scipy.spatial import distance
 
-from maze3D_new.config import left_down, right_down, left_up, center
+from maze3D_new.layouts import left_down, right_down, left_up, center
 from plot_utils.plot_utils import plot_learning_curve, plot, plot_test_score, plot_mean_sem
 
 goals = {"left_down": left_down, "left_up": left_up, "right_down": right_down}
@@ -66,6 +66,11 @@ def save_logs_and_plot(experiment, chkpt_dir, plot_dir, max_games):
     np.savetxt(chkpt_dir + '/pure_rewards_test.csv', experiment.test_reward_list, delimiter=',')
 
     np.savetxt(chkpt_dir + '/grad_updates_durations.csv', experiment.grad_updates_durations, delimiter=',')
+    if experiment.learner is not None:
+        np.savetxt(chkpt_dir + '/grad_updates_request_durations.csv', experiment.grad_updates_request_durations,
+                   delimiter=',')
+    if experiment.policy_worker is not None:
+        np.savetxt(chkpt_dir + '/action_staleness.csv', experiment.policy_worker.staleness, delimiter=',')
 
     # test_game_number logs
     np.savetxt(chkpt_dir + '/test_episode_duration_list.csv', experiment.test_game_duration_list, delimiter=',')
@@ -0,0 +1,92 @@
+"""
+Latency of the discrete SAC agent's decisions.
+    python misc/inference_benchmark.py [decisions]
+times every decision on a single game state with the previous Actor.sample_act (autograd, a new tensor and a
+Categorical per decision), the current Actor.sample_act / greedy_act and the NumpyActor copy of the actor, and prints
+the p50 and p99 latencies, then the time per state of the batched Actor.sample_acts and NumpyActor.sample_acts for
+several batch sizes. Also checks that the greedy actions agree, single and batched, and that the sampled actions
+follow the same probabilities.
+"""
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.distributions import Categorical
+
+from rl_models.networks_discrete import Actor, NumpyActor
+
+seed = 0
+
+
+def legacy_sample_act(actor, s):
+    s = torch.from_numpy(s).float()
+    actions_probs = F.softmax(actor.actor_mlp(s), dim=-1)
+    return Categorical(actions_probs).sample().item()
+
+
+def latencies(decide, states):
+    """
+    :return: the p50 and p99 latencies of the decisions in microseconds
+    """
+    # warm up
+    for state in states[:100]:
+        decide(state)
+    elapsed = np.empty(len(states))
+    for i, state in enumerate(states):
+        start = time.perf_counter()
+        decide(state)
+        elapsed[i] = time.perf_counter() - start
+    return np.percentile(elapsed, 50) * 1e6, np.percentile(elapsed, 99) * 1e6
+
+
+def batch_time(decide, states, batch_size):
+    """
+    :return: the time per state in microseconds of the decisions on batches of batch_size states
+    """
+    batches = [states[i:i + batch_size] for i in range(0, len(states) - batch_size + 1, batch_size)]
+    decide(batches[0])
+    start = time.perf_counter()
+    for batch in batches:
+        decide(batch)
+    return (time.perf_counter() - start) / (len(batches) * batch_size) * 1e6
+
+
+def main(decisions=20000):
+    torch.manual_seed(seed)
+    torch.set_num_threads(1)
+    rng = np.random.RandomState(seed)
+    actor = Actor(8, 3, 256, chkpt_dir=tempfile.mkdtemp())
+    numpy_actor = NumpyActor(actor)
+    # game states: ball position in pixels, velocities and tray rotations
+    states = rng.uniform(-1, 1, (decisions, 8)) * [150, 150, 5, 5, 30, 30, 1, 1]
+
+    for name, decide in [('legacy Actor.sample_act', lambda s: legacy_sample_act(actor, s)),
+                         ('Actor.sample_act', actor.sample_act), ('Actor.greedy_act', actor.greedy_act),
+                         ('NumpyActor.sample_act', numpy_actor.sample_act),
+                         ('NumpyActor.greedy_act', numpy_actor.greedy_act)]:
+        print('%-24s p50 %6.1f us, p99 %6.1f us' % ((name,) + latencies(decide, states)))
+
+    for batch_size in [1, 16, 256]:
+        print('batch %3d: Actor.sample_acts %5.1f us/state, NumpyActor.sample_acts %5.1f us/state'
+              % (batch_size, batch_time(actor.sample_acts, states, batch_size),
+                 batch_time(numpy_actor.sample_acts, states, batch_size)))
+
+    greedy_agree = np.mean([actor.greedy_act(s) == numpy_actor.greedy_act(s) for s in states[:1000]])
+    single = [actor.greedy_act(s) for s in states[:1000]]
+    assert np.array_equal(actor.greedy_acts(states[:1000]), single)
+    assert np.mean(numpy_actor.greedy_acts(states[:1000]) == single) == greedy_agree
+    # the frequencies of the sampled actions on one state
+    state = states[0]
+    with torch.no_grad():
+        probs = actor(torch.from_numpy(state).float()).numpy()
+    frequencies = np.bincount([numpy_actor.sample_act(state) for _ in range(decisions)], minlength=3) / decisions
+    batch_frequencies = np.bincount(actor.sample_acts(np.tile(state, (decisions, 1))), minlength=3) / decisions
+    print('greedy actions agree on %.1f%% of the states, action probabilities %s, NumPy sampled frequencies %s, '
+          'batched sampled frequencies %s' % (greedy_agree * 100, np.round(probs, 3), np.round(frequencies, 3),
+                                               np.round(batch_frequencies, 3)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
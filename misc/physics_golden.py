@@ -0,0 +1,104 @@
+"""
+Golden trajectories of the ball physics.
+    python misc/physics_golden.py record   stores the trajectories of the current implementation
+    python misc/physics_golden.py check    replays them with the pure python and, if numba is installed, the compiled
+                                           physics kernel, fails if they diverge and prints the ticks/sec
+"""
+import os
+import sys
+import time
+import numpy as np
+
+from maze3D_new import physics
+from maze3D_new.gameObjects import GameBoard
+from maze3D_new.layouts import layout_up_right, layout_down_right, layout_up_left, layout_10_up_right
+
+golden_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'physics_golden.npz')
+layouts = {'layout_10_up_right': layout_10_up_right, 'layout_up_right': layout_up_right,
+           'layout_down_right': layout_down_right, 'layout_up_left': layout_up_left}
+# (layout, discrete, rl, seed) of every trajectory
+runs = [(name, discrete, rl, seed) for name in layouts for discrete, rl in [(False, True), (False, False), (True, True)]
+        for seed in range(1)]
+num_ticks = 2000
+# the actions are kept for action_ticks physics ticks, like an agent acting every 200ms at 60 fps
+action_ticks = 12
+# the states of every sample_every-th tick, ending with the last one, are recorded. a divergence between two samples
+# carries over to the next ones
+sample_every = 10
+tolerance = 1e-9
+
+
+def actions(seed):
+    rng = np.random.RandomState(seed)
+    return np.repeat(rng.randint(0, 3, size=(num_ticks // action_ticks + 1, 2)), action_ticks, axis=0)[:num_ticks]
+
+
+def play(name, discrete, rl, seed, physics_only=False, compiled=False):
+    """
+    Plays the seeded random actions on a new board.
+    :param physics_only: True to only move the ball, without the model matrices of GameBoard.update
+    :param compiled: True to use the numba compiled physics kernel
+    :return: (num_ticks, 8) array of the board's state after every tick and the elapsed seconds
+    """
+    board = GameBoard(layouts[name], discrete, rl)
+    board.setPhysicsKernel(compiled)
+    update = board.ball.update if physics_only else board.update
+    trajectory = np.empty((num_ticks, 8))
+    start = time.perf_counter()
+    for tick, action in enumerate(actions(seed).tolist()):
+        board.handleKeys(action)
+        update()
+        trajectory[tick] = [board.ball.x, board.ball.y, board.ball.velocity[0], board.ball.velocity[1],
+                            board.rot_x, board.rot_y, board.velocity[0], board.velocity[1]]
+    return trajectory, time.perf_counter() - start
+
+
+def sampled(trajectory):
+    """
+    :return: the recorded states of a trajectory
+    """
+    return trajectory[sample_every - 1::sample_every]
+
+
+def record():
+    np.savez_compressed(golden_file, **{'%s_%d_%d_%d' % run: sampled(play(*run)[0]) for run in runs})
+    print('recorded %d trajectories in %s' % (len(runs), golden_file))
+
+
+def compare(physics_only, compiled):
+    """
+    :return: the max error from the golden trajectories, or None if a trajectory diverges, and the ticks/sec
+    """
+    golden = np.load(golden_file)
+    elapsed, max_error = 0, 0
+    for run in runs:
+        trajectory, seconds = play(*run, physics_only=physics_only, compiled=compiled)
+        elapsed += seconds
+        error = np.abs(sampled(trajectory) - golden['%s_%d_%d_%d' % run]).max(axis=1)
+        max_error = max(max_error, error.max())
+        if error.max() > tolerance:
+            tick = (np.argmax(error > tolerance) + 1) * sample_every - 1
+            print('%s_%d_%d_%d diverges by tick %d by %g' % (run + (tick, error.max())))
+            return None, 0
+    return max_error, len(runs) * num_ticks / elapsed
+
+
+def check():
+    for compiled in [False, True] if physics.step_ball_compiled is not None else [False]:
+        # warm up, numba compiles the kernel on its first call
+        play(*runs[0], physics_only=True, compiled=compiled)
+        for physics_only in [False, True]:
+            max_error, ticks_per_sec = compare(physics_only, compiled)
+            if max_error is None:
+                return 1
+            print('%s kernel: %d trajectories match, max error %g, %.0f ticks/sec %s' %
+                  ('numba' if compiled else 'python', len(runs), max_error, ticks_per_sec,
+                   '(physics only)' if physics_only else '(GameBoard.update)'))
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ['record', 'check']:
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(record() if sys.argv[1] == 'record' else check())
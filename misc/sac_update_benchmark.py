@@ -0,0 +1,248 @@
+"""
+Benchmark of the gradient updates of DiscreteSACAgent.
+    python misc/sac_update_benchmark.py [updates] [batch_size]
+runs the same seeded updates, on the same mini-batches, with the update step of the baseline (legacy: learn,
+soft_update_target and the losses copied verbatim from the baseline commit) and with the current DiscreteSACAgent,
+with and without clipping the gradients, each in its own process. Prints the updates/sec, the peak memory growth
+during the updates and the largest difference from the legacy learning curve (entropy and alpha after every update)
+and final weights.
+The legacy step clipped the gradients before the backward passes, so clipping had no effect on the gradients it
+applied. The current step clips them after the backward pass, which changes the training numerics: compare the
+legacy curve with the unclipped current step for the effect of the rework alone.
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from rl_models.sac_discrete_agent import DiscreteSACAgent, device
+
+seed = 0
+buffer_size = 20000
+
+
+def update_params(optim, loss):
+    optim.zero_grad()
+    loss.backward(retain_graph=True)
+    optim.step()
+
+
+class DataOptimizer:
+    """
+    The optimizers of torch 1.4, pinned by the baseline, updated the parameters through .data, which autograd does not
+    track, so the graphs retained by the baseline's update step stayed valid after an optimizer step. The optimizers of
+    torch >= 1.5 update the parameters in place, which invalidates those graphs (the next backward pass fails). This
+    wrapper steps a copy of the optimizer on aliases of the parameters' .data instead, with the gradients of the
+    parameters, like torch 1.4.
+    """
+    def __init__(self, optim):
+        self.params = [param for group in optim.param_groups for param in group['params']]
+        self.aliases = [torch.nn.Parameter(param.data) for param in self.params]
+        self.optim = type(optim)(self.aliases, **optim.defaults)
+
+    def zero_grad(self):
+        for param in self.params:
+            if param.grad is not None:
+                param.grad.detach_()
+                param.grad.zero_()
+
+    def step(self):
+        for alias, param in zip(self.aliases, self.params):
+            alias.grad = param.grad
+        self.optim.step()
+
+
+class LegacyDiscreteSACAgent(DiscreteSACAgent):
+    """DiscreteSACAgent with the update step of the baseline, copied verbatim"""
+    def __init__(self, *args, **kwargs):
+        super(LegacyDiscreteSACAgent, self).__init__(*args, **kwargs)
+        self.actor_optim = DataOptimizer(self.actor_optim)
+        self.critic_q1_optim = DataOptimizer(self.critic_q1_optim)
+        self.critic_q2_optim = DataOptimizer(self.critic_q2_optim)
+        self.alpha_optim = DataOptimizer(self.alpha_optim)
+
+    def learn(self, interaction=None):
+        if interaction is None:
+            states, actions, rewards, states_, dones = self.memory.sample(self.batch_size)
+        else:
+            states, actions, rewards, states_, dones = interaction
+            states, actions, rewards, states_, dones = [np.asarray([states]), np.asarray([actions]),
+                                                        np.asarray([rewards]), np.asarray([states_]),
+                                                        np.asarray([dones])]
+        states = torch.from_numpy(states).float().to(device)
+        states_ = torch.from_numpy(states_).float().to(device)
+        actions = torch.tensor(actions, dtype=torch.long).to(device).unsqueeze(1)  # dim [Batch,] -> [Batch, 1]
+        # rewards = (rewards - rewards.mean()) / (rewards.std() + 1e-5)
+        rewards = torch.tensor(rewards).float().to(device)
+        dones = torch.tensor(dones).float().to(device)
+
+        batch_transitions = states, actions, rewards, states_, dones
+
+        weights = 1.  # default
+        q1_loss, q2_loss, errors, mean_q1, mean_q2 = self.calc_critic_loss(batch_transitions, weights)
+        policy_loss, entropies = self.calc_policy_loss(batch_transitions, weights)
+        entropy_loss = self.calc_entropy_loss(entropies, weights)
+
+        torch.nn.utils.clip_grad_norm_(self.critic.parameters(), 5)
+        update_params(self.critic_q1_optim, q1_loss)
+        update_params(self.critic_q2_optim, q2_loss)
+        torch.nn.utils.clip_grad_norm_(self.actor.parameters(), 5)
+        update_params(self.actor_optim, policy_loss)
+        update_params(self.alpha_optim, entropy_loss)
+
+        return mean_q1, mean_q2, entropies
+
+    def update_target(self):
+        self.target_critic.load_state_dict(self.critic.state_dict())
+
+    def soft_update_target(self):
+        for target_param, param in zip(self.target_critic.parameters(), self.critic.parameters()):
+            target_param.data.copy_(self.tau * param + (1 - self.tau) * target_param)
+
+    def calc_current_q(self, states, actions, rewards, next_states, dones):
+        curr_q1, curr_q2 = self.critic(states)
+        curr_q1 = curr_q1.gather(1, actions)  # select the Q corresponding to chosen A
+        curr_q2 = curr_q2.gather(1, actions)
+        return curr_q1, curr_q2
+
+    def calc_critic_loss(self, batch, weights):
+        target_q = self.calc_target_q(*batch)
+
+        # TD errors for updating priority weights
+        # errors = torch.abs(curr_q1.detach() - target_q)
+        errors = None
+        mean_q1, mean_q2 = None, None
+
+        # We log means of Q to monitor training.
+        # mean_q1 = curr_q1.detach().mean().item()
+        # mean_q2 = curr_q2.detach().mean().item()
+
+        # Critic loss is mean squared TD errors with priority weights.
+        # q1_loss = torch.mean((curr_q1 - target_q).pow(2) * weights)
+        # q2_loss = torch.mean((curr_q2 - target_q).pow(2) * weights)
+        curr_q1, curr_q2 = self.calc_current_q(*batch)
+        q1_loss = F.mse_loss(curr_q1, target_q)
+        q2_loss = F.mse_loss(curr_q2, target_q)
+
+        return q1_loss, q2_loss, errors, mean_q1, mean_q2
+
+    def calc_policy_loss(self, batch, weights):
+        states, actions, rewards, next_states, dones = batch
+
+        # (Log of) probabilities to calculate expectations of Q and entropies.
+        action_probs = self.actor(states)
+        z = (action_probs == 0.0).float() * 1e-8  # for numerical stability
+        log_action_probs = torch.log(action_probs + z)
+
+        # with torch.no_grad():
+        # Q for every actions to calculate expectations of Q.
+        # q1, q2 = self.critic(states)
+        # q = torch.min(q1, q2)
+
+        q1, q2 = self.critic(states)
+
+        alpha = self.log_alpha.exp()
+        # minq = torch.min(q1, q2)
+        # inside_term = alpha * log_action_probs - minq
+        # policy_loss = (action_probs * inside_term).mean()
+
+        # Expectations of entropies.
+        entropies = - torch.sum(action_probs * log_action_probs, dim=1)
+        # Expectations of Q.
+        q = torch.sum(torch.min(q1, q2) * action_probs, dim=1, keepdim=True)
+
+        # Policy objective is maximization of (Q + alpha * entropy) with
+        # priority weights.
+        policy_loss = (weights * (- q - alpha * entropies)).mean()  # avg over Batch
+
+        return policy_loss, entropies
+
+
+def memory_mb(field):
+    """
+    :param field: VmRSS for the resident memory of the process, VmHWM for its peak since the last reset_peak_rss
+    """
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+
+
+def reset_peak_rss():
+    # resets VmHWM to the current resident memory (Linux), so that the peak is only that of the updates
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+
+
+class BatchMemory:
+    """Replay buffer returning the pre-sampled mini-batches in order"""
+    def __init__(self, batches):
+        self.batches = iter(batches)
+
+    def sample(self, batch_size):
+        return next(self.batches)
+
+
+def run(variant, updates, batch_size):
+    """
+    :return: the updates/sec, the peak memory growth during the updates in MB, the learning curve and the final weights
+    """
+    torch.set_num_threads(1)
+    rng = np.random.RandomState(seed)
+    transitions = [rng.uniform(-1, 1, (buffer_size, 8)).astype(np.float32), rng.randint(3, size=buffer_size),
+                   rng.uniform(-1, 1, buffer_size).astype(np.float32),
+                   rng.uniform(-1, 1, (buffer_size, 8)).astype(np.float32),
+                   (rng.rand(buffer_size) < 0.05).astype(np.float32)]
+    batches = [tuple(column[idxes] for column in transitions)
+               for idxes in rng.randint(0, buffer_size, (updates + 1, batch_size))]
+    agent_class = LegacyDiscreteSACAgent if variant == 'legacy' else DiscreteSACAgent
+    agents = []
+    for _ in range(2):
+        torch.manual_seed(seed)
+        agents.append(agent_class(chkpt_dir=tempfile.mkdtemp(), n_actions=3, batch_size=batch_size))
+    # the first agent warms up torch
+    agents[0].memory = BatchMemory(batches[:1])
+    agents[0].learn()
+    agent = agents[1]
+    agent.memory = BatchMemory(batches[1:])
+    if variant == 'unclipped':
+        agent.max_grad_norm = None
+
+    curve = []
+    reset_peak_rss()
+    start_rss = memory_mb('VmRSS')
+    start = time.perf_counter()
+    for _ in range(updates):
+        # both agents sample their mini-batch and convert it to tensors in learn
+        entropies = agent.learn()[2]
+        agent.soft_update_target()
+        curve.append([entropies.detach().mean().item(), agent.log_alpha.item()])
+    elapsed = time.perf_counter() - start
+    peak = memory_mb('VmHWM') - start_rss
+    weights = torch.cat([p.detach().flatten() for p in list(agent.actor.parameters()) +
+                         list(agent.critic.parameters())]).tolist()
+    return updates / elapsed, peak, curve, weights
+
+
+def main(updates=500, batch_size=256):
+    results = {}
+    for variant in ['legacy', 'current', 'unclipped']:
+        output = subprocess.run([sys.executable, __file__, '--run', variant, str(updates), str(batch_size)],
+                                check=True, stdout=subprocess.PIPE).stdout
+        results[variant] = json.loads(output.decode().splitlines()[-1])
+    for variant, (updates_per_sec, peak, curve, weights) in results.items():
+        curve_error = np.abs(np.subtract(results['legacy'][2], curve)).max()
+        weights_error = np.abs(np.subtract(results['legacy'][3], weights)).max()
+        print('%-9s %6.1f updates/sec, peak memory growth %5.1f MB, max difference from legacy: curve %g, weights %g'
+              % (variant, updates_per_sec, peak, curve_error, weights_error))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        print(json.dumps(run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
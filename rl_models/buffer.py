@@ -1,14 +1,46 @@
+import os
+import queue
+import threading
 import numpy as np
 
+
+def open_memory(directory, name, shape, dtype):
+    """
+    Allocates an array of a replay buffer.
+    :param directory: None to keep the array in RAM, else the directory of its memory mapped .npy file
+    :param name: the name of the file
+    :param shape: the shape of the array
+    :param dtype: the dtype of the array
+    :return: a zero array, or the memory mapped file, reopened with its contents if it already exists
+    """
+    if directory is None:
+        return np.zeros(shape, dtype=dtype)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.npy')
+    if os.path.exists(path):
+        memory = np.load(path, mmap_mode='r+')
+        if memory.shape != tuple(shape) or memory.dtype != dtype:
+            raise ValueError("{} stores a {} {} array instead of {} {}".format(path, memory.shape, memory.dtype,
+                                                                            tuple(shape), np.dtype(dtype)))
+        return memory
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
 class ReplayBuffer():
-    def __init__(self, max_size, input_shape, n_actions):
+    def __init__(self, max_size, input_shape, n_actions, directory=None):
+        """
+        :param directory: if given, the buffer is stored in memory mapped files in this directory, written as the
+        transitions are stored, and reopened from there by the next buffer using it
+        """
         self.mem_size = max_size
-        self.mem_cntr = 0
-        self.state_memory = np.zeros((self.mem_size, *input_shape))
-        self.new_state_memory = np.zeros((self.mem_size, *input_shape))
-        self.action_memory = np.zeros((self.mem_size, n_actions))
-        self.reward_memory = np.zeros(self.mem_size)
-        self.terminal_memory = np.zeros(self.mem_size, dtype=np.bool)
+        self.state_memory = open_memory(directory, 'states', (self.mem_size, *input_shape), np.float64)
+        self.new_state_memory = open_memory(directory, 'new_states', (self.mem_size, *input_shape), np.float64)
+        self.action_memory = open_memory(directory, 'actions', (self.mem_size, n_actions), np.float64)
+        self.reward_memory = open_memory(directory, 'rewards', (self.mem_size,), np.float64)
+        self.terminal_memory = open_memory(directory, 'terminals', (self.mem_size,), np.bool_)
+        # the stored transitions counter, kept with the transitions
+        self.counter_memory = open_memory(directory, 'counter', (1,), np.int64)
+        self.mem_cntr = int(self.counter_memory[0])
 
     def store_transition(self, state, action, reward, state_, done):
         index = self.mem_cntr % self.mem_size
@@ -20,6 +52,7 @@ class ReplayBuffer():
         self.terminal_memory[index] = done
 
         self.mem_cntr += 1
+        self.counter_memory[0] = self.mem_cntr
 
     def sample_buffer(self, batch_size):
         max_mem = min(self.mem_cntr, self.mem_size)
@@ -34,4 +67,67 @@ class ReplayBuffer():
 
         return states, actions, rewards, states_, dones
 
+    def flush(self):
+        # writes the memory mapped files to the disk
+        for memory in [self.state_memory, self.new_state_memory, self.action_memory, self.reward_memory,
+                       self.terminal_memory, self.counter_memory]:
+            if isinstance(memory, np.memmap):
+                memory.flush()
+
+
+class BatchPrefetcher:
+    """
+    Prepares the next mini-batches in a background thread while the current one is used for a gradient update,
+    keeping up to size batches ready in a queue.
+    """
+    def __init__(self, sample, count, size=4):
+        """
+        :param sample: function returning a mini-batch, e.g. DiscreteSACAgent.sample_batch
+        :param count: the number of mini-batches to prepare
+        :param size: the max number of mini-batches waiting in the queue
+        """
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._prepare, args=(sample, count), daemon=True)
+        self.thread.start()
+
+    def _prepare(self, sample, count):
+        try:
+            for _ in range(count):
+                if not self._put(sample()):
+                    return
+        except Exception as error:
+            # raised by get in the main thread
+            self._put(error)
+
+    def _put(self, item):
+        # waits for a free place in the queue, unless the prefetcher is closed
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self):
+        """
+        :return: the next mini-batch
+        """
+        item = self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self):
+        """Stops the background thread and drops the mini-batches that were not used"""
+        self.stopped.set()
+        self.thread.join()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
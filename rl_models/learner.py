@@ -0,0 +1,369 @@
+import copy
+import inspect
+import io
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+import numpy as np
+import torch
+
+from rl_models.polyak import flatten_parameters
+
+
+class AsyncLearner:
+    """
+    Trains a DiscreteSACAgent in a background thread while the games are played with a copy of its actor, the policy.
+    After every chunk of updates the learner publishes a new version of the actor's weights, and the game copies the
+    latest version into the policy at safe points (sync_policy), e.g. before the agent's decisions.
+    """
+    def __init__(self, agent, chunk=100):
+        """
+        :param agent: the agent to train. the game adds its transitions to the agent's replay buffer
+        :param chunk: the max number of updates between two versions of the actor's weights
+        """
+        self.agent = agent
+        self.chunk = chunk
+        self.policy = copy.deepcopy(agent.actor)
+        self.actor_parameters = flatten_parameters(agent.actor)
+        self.policy_parameters = flatten_parameters(self.policy)
+        # the latest published weights of the actor and their version
+        self.published = self.actor_parameters.clone()
+        self.version, self.policy_version = 0, 0
+        self.lock = threading.Lock()
+        # the requested numbers of updates and function calls, in order
+        self.requests = queue.Queue()
+        self.error = None
+        # the seconds spent on updates
+        self.busy_time = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, obs, action, reward, obs_, done):
+        """Adds a transition of the game to the agent's replay buffer"""
+        self.agent.memory.add(obs, action, reward, obs_, done)
+
+    def learn(self, updates):
+        """
+        Requests gradient updates, each followed by a soft update of the target critic.
+        :param updates: the number of updates
+        """
+        self._check()
+        self.requests.put(updates)
+
+    def call(self, function):
+        """
+        Calls a function in the learner thread after the updates requested so far.
+        """
+        self._check()
+        self.requests.put(function)
+
+    def save_models(self):
+        """Saves the agent's models after the updates requested so far"""
+        self.call(self.agent.save_models)
+
+    def sync_policy(self):
+        """
+        Copies the latest published weights of the actor into the policy, if they are newer.
+        :return: the version of the policy's weights
+        """
+        self._check()
+        if self.version != self.policy_version:
+            with self.lock:
+                self.policy_parameters.copy_(self.published)
+                self.policy_version = self.version
+        return self.policy_version
+
+    def wait(self):
+        """Waits for the requested updates and calls"""
+        self.requests.join()
+        self._check()
+
+    def close(self):
+        """Waits for the requested updates and calls and stops the learner thread"""
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+        self._check()
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            try:
+                if request is None:
+                    return
+                # after an error the remaining requests are dropped, the error is raised in the game's thread
+                if self.error is None:
+                    if callable(request):
+                        request()
+                    else:
+                        self._learn(request)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.requests.task_done()
+
+    def _learn(self, updates):
+        start = time.time()
+        for done in range(0, updates, self.chunk):
+            self.agent.learn_many(min(self.chunk, updates - done))
+            with self.lock:
+                self.published.copy_(self.actor_parameters)
+                self.version += 1
+        self.busy_time += time.time() - start
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+
+def agent_parameters(agent):
+    """
+    :return: the tensors trained by a DiscreteSACAgent: the parameters of its actor, critic and target critic and its
+    log alpha, starting with the actor
+    """
+    return list(agent.actor.parameters()) + list(agent.critic.parameters()) + \
+        list(agent.target_critic.parameters()) + [agent.log_alpha]
+
+
+class TransitionQueue:
+    """
+    Ring of transitions in shared memory, written by one process and read by another.
+    A transition is published by incrementing the written counter after its row is written. When the ring is full,
+    the reader lagging behind, the new transitions are dropped and counted instead of blocking the writer.
+    """
+    def __init__(self, capacity, state_size):
+        self.capacity = capacity
+        # the number of transitions dropped by the writer
+        self.dropped = 0
+        # (ctype, shape) of every column
+        columns = {'obses': ('f', (capacity, state_size)), 'actions': ('q', (capacity,)),
+                   'rewards': ('f', (capacity,)), 'obses_': ('f', (capacity, state_size)), 'dones': ('b', (capacity,)),
+                   # the number of transitions written and read
+                   'counters': ('q', (2,))}
+        self.raw = {name: (mp.RawArray(ctype, int(np.prod(shape))), ctype, shape)
+                    for name, (ctype, shape) in columns.items()}
+        self._map()
+
+    def _map(self):
+        # the columns are arrays on the shared memory
+        for name, (raw, ctype, shape) in self.raw.items():
+            setattr(self, name, np.frombuffer(raw, dtype=np.dtype(ctype)).reshape(shape))
+
+    def __getstate__(self):
+        # the shared memory, e.g. sent to the learner process
+        return self.capacity, self.dropped, self.raw
+
+    def __setstate__(self, state):
+        self.capacity, self.dropped, self.raw = state
+        self._map()
+
+    def put(self, obs, action, reward, obs_, done):
+        """
+        :return: True if the transition was written, False if it was dropped because the ring is full
+        """
+        written = int(self.counters[0])
+        if written - int(self.counters[1]) >= self.capacity:
+            self.dropped += 1
+            return False
+        idx = written % self.capacity
+        self.obses[idx] = obs
+        self.actions[idx] = action
+        self.rewards[idx] = reward
+        self.obses_[idx] = obs_
+        self.dones[idx] = done
+        self.counters[0] = written + 1
+        return True
+
+    def get_all(self):
+        """
+        :return: the obses, actions, rewards, next obses and dones written since the last call
+        """
+        read, written = int(self.counters[1]), int(self.counters[0])
+        idxes = np.arange(read, written) % self.capacity
+        transitions = self.obses[idxes], self.actions[idxes], self.rewards[idxes], self.obses_[idxes], self.dones[idxes]
+        self.counters[1] = written
+        return transitions
+
+
+def dump_agent(agent):
+    """
+    :return: the agent saved in bytes with torch.save, that keeps the parameters which are views of a flat tensor
+    (see flatten_parameters) views of the same tensor, unlike pickle
+    """
+    data = io.BytesIO()
+    torch.save(agent, data)
+    return data.getvalue()
+
+
+def load_agent(data):
+    """
+    :param data: the bytes of dump_agent
+    :return: the copy of the agent
+    """
+    # the recent versions of torch only load tensors by default
+    kwargs = {'weights_only': False} if 'weights_only' in inspect.signature(torch.load).parameters else {}
+    return torch.load(io.BytesIO(data), **kwargs)
+
+
+def publish(parameters, published):
+    """Copies the parameters into the flat tensor of the shared memory block"""
+    with torch.no_grad():
+        published.copy_(torch.cat([parameter.detach().reshape(-1) for parameter in parameters]))
+
+
+class ProcessLearner:
+    """
+    Trains a DiscreteSACAgent in a separate process, so that the training neither holds the game's GIL nor shares its
+    cores. The game adds its transitions to a TransitionQueue in shared memory, which the learner moves to the agent's
+    replay buffer. After every chunk of updates the learner publishes the weights of the agent's networks in a shared
+    memory block with a new version, copied into the agent by sync_policy and close. The game acts with the agent's
+    actor (the policy).
+    The learner process is spawned, not forked, so it can start after the game window or CUDA are initialized. It
+    trains a copy of the agent as it was when the learner was created: its networks, optimizers and replay buffer
+    (reopened from its files if it is persistent), without the environment.
+    """
+    def __init__(self, agent, chunk=100, queue_size=100000):
+        """
+        :param agent: the agent to train. its models are trained and saved by the learner process
+        :param chunk: the max number of updates between two versions of the actor's weights
+        :param queue_size: the max number of transitions waiting for the learner
+        """
+        self.agent = agent
+        self.chunk = chunk
+        context = mp.get_context('spawn')
+        self.transitions = TransitionQueue(queue_size, agent.input_dims)
+        self.policy = agent.actor
+        self.parameters = agent_parameters(agent)
+        # the latest published weights of the agent and their version
+        raw = mp.RawArray('f', sum(parameter.numel() for parameter in self.parameters))
+        self.published = torch.from_numpy(np.frombuffer(raw, dtype=np.float32))
+        publish(self.parameters, self.published)
+        self.version = mp.RawValue('q', 0)
+        self.policy_version = 0
+        # the seconds spent on updates, published with the versions
+        self.busy_seconds = mp.RawValue('d', 0)
+        self.lock = context.Lock()
+        self.connection, learner_connection = context.Pipe()
+        self.process = context.Process(target=run_learner, daemon=True,
+                                       args=(dump_agent(agent), chunk, self.transitions, raw, self.version,
+                                             self.busy_seconds, self.lock, learner_connection))
+        self.process.start()
+        learner_connection.close()
+
+    @property
+    def busy_time(self):
+        """The seconds spent on updates so far"""
+        return self.busy_seconds.value
+
+    @property
+    def dropped(self):
+        """The number of transitions dropped because the learner lagged behind"""
+        return self.transitions.dropped
+
+    def add(self, obs, action, reward, obs_, done):
+        """Sends a transition of the game to the learner, dropped if queue_size transitions are already waiting"""
+        if not self.transitions.put(obs, action, reward, obs_, done) and self.transitions.dropped == 1:
+            print('The learner process lags behind, dropping the new transitions')
+
+    def learn(self, updates):
+        """
+        Requests gradient updates, each followed by a soft update of the target critic, on the transitions added so
+        far.
+        :param updates: the number of updates
+        """
+        self._check()
+        self.connection.send(('learn', updates))
+
+    def save_models(self):
+        """Saves the agent's models after the updates requested so far"""
+        self._check()
+        self.connection.send(('save', None))
+
+    def sync_policy(self):
+        """
+        Copies the latest published weights into the agent's networks, including the policy, if they are newer.
+        :return: the version of the policy's weights
+        """
+        self._check()
+        if self.version.value != self.policy_version:
+            with self.lock, torch.no_grad():
+                offset = 0
+                for parameter in self.parameters:
+                    parameter.copy_(self.published[offset:offset + parameter.numel()].view_as(parameter))
+                    offset += parameter.numel()
+                self.policy_version = self.version.value
+        return self.policy_version
+
+    def wait(self):
+        """Waits for the requested updates and calls"""
+        self._check()
+        self.connection.send(('wait', None))
+        self._receive(self.connection.recv())
+
+    def close(self):
+        """Waits for the requested updates and calls, stops the learner process and copies the final weights into
+        the agent"""
+        self._check()
+        if self.process.is_alive():
+            self.connection.send(('close', None))
+            self._receive(self.connection.recv())
+            self.process.join()
+            self.connection.close()
+            self.sync_policy()
+
+    def _check(self):
+        # raises the error of the learner process, if any
+        while not self.connection.closed and self.connection.poll():
+            self._receive(self.connection.recv())
+
+    def _receive(self, message):
+        kind, value = message
+        if kind == 'error':
+            raise RuntimeError('the learner process failed:\n' + value)
+
+
+def run_learner(agent_data, chunk, transitions, published, version, busy_seconds, lock, connection):
+    """
+    The learner process of a ProcessLearner. The game process keeps a core.
+    :param agent_data: the agent, from dump_agent
+    :param published: the shared memory block of the weights of the agent's networks
+    """
+    torch.set_num_threads(max(1, mp.cpu_count() - 1))
+    requests, pending = [], 0
+    try:
+        agent = load_agent(agent_data)
+        parameters = agent_parameters(agent)
+        published = torch.from_numpy(np.frombuffer(published, dtype=np.float32))
+        while True:
+            if pending == 0 and not requests:
+                connection.poll(0.05)
+            while connection.poll():
+                requests.append(connection.recv())
+            # the transitions of the requests are sent before them
+            for transition in zip(*transitions.get_all()):
+                agent.memory.add(*transition)
+
+            if pending > 0:
+                start = time.time()
+                updates = min(chunk, pending)
+                agent.learn_many(updates)
+                pending -= updates
+                with lock:
+                    publish(parameters, published)
+                    version.value += 1
+                    busy_seconds.value += time.time() - start
+            elif requests:
+                command, value = requests.pop(0)
+                if command == 'learn':
+                    pending += value
+                elif command == 'save':
+                    agent.save_models()
+                elif command == 'wait':
+                    connection.send(('done', None))
+                elif command == 'close':
+                    connection.send(('closed', None))
+                    return
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
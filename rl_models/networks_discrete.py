@@ -2,11 +2,13 @@ import os
 
 import torch
 import torch.nn as nn
-from torch.distributions import Categorical
 import numpy as np
 import torch.nn.functional as F
 
 import random
+import threading
+
+from rl_models.buffer import open_memory
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -20,12 +22,46 @@ def initialize_weights_he(m):
             torch.nn.init.constant_(m.bias, 0)
 
 
-# why retain graph? Do not auto free memory for one loss when computing multiple loss
-# https://stackoverflow.com/questions/46774641/what-does-the-parameter-retain-graph-mean-in-the-variables-backward-method
-def update_params(optim, loss):
-    optim.zero_grad()
-    loss.backward(retain_graph=True)
-    optim.step()
+def update_params(optims, loss, parameters=None, max_grad_norm=None):
+    """
+    Performs a gradient step on a loss. Its graph is freed by the backward pass, so the losses of an update must not
+    share a graph.
+    :param optims: the optimizer, or list of optimizers, of the parameters to update
+    :param loss: the loss to minimize
+    :param parameters: the parameters whose gradients are clipped after the backward pass
+    :param max_grad_norm: the max norm of the gradients of parameters. None to not clip them
+    """
+    optims = optims if isinstance(optims, list) else [optims]
+    for optim in optims:
+        optim.zero_grad()
+    loss.backward()
+    if max_grad_norm is not None:
+        torch.nn.utils.clip_grad_norm_(parameters, max_grad_norm)
+    for optim in optims:
+        optim.step()
+
+
+def sample_categorical(probs):
+    """
+    Samples an action by inverting the cumulative sum of the action probabilities at a uniform random value from
+    NumPy's random numbers, for NumpyActor.
+    :param probs: the (unnormalized) probabilities of the actions
+    :return: the index of the action
+    """
+    cumulative = np.cumsum(probs)
+    return int(np.searchsorted(cumulative, np.random.random() * cumulative[-1], side='right'))
+
+
+def sample_categoricals(probs):
+    """
+    Samples an action for every row of probabilities, as sample_categorical, with a uniform random value per row, for
+    NumpyActor.
+    :param probs: (N, n_actions) array of the (unnormalized) probabilities of the actions
+    :return: (N,) array of the indices of the actions
+    """
+    cumulative = np.cumsum(probs, axis=-1)
+    values = np.random.random((len(cumulative), 1)) * cumulative[:, -1:]
+    return (cumulative <= values).sum(axis=-1)
 
 
 def init_weights(m):
@@ -36,43 +72,200 @@ def init_weights(m):
 
 class ReplayBuffer:
     """
-    Convert to numpy
+    Ring buffer of transitions, stored column by column in pre-allocated arrays.
+    The arrays are allocated on the first transition if the shape of the observations is not given.
+    If a directory is given, the arrays are memory mapped files in it, written as the transitions are added and
+    reopened with their transitions by the next buffer using the directory (e.g. when resuming from a checkpoint).
     """
-    def __init__(self, memory_size):
-        self.storage = []
+    def __init__(self, memory_size, input_shape=None, directory=None):
         self.memory_size = memory_size
-        self.next_idx = 0
+        self.directory = directory
+        # the next index to write and the number of stored transitions, kept with the transitions
+        self.counters = open_memory(directory, 'counters', (2,), np.int64)
+        self.next_idx, self.size = self.counters.tolist()
+        # the transitions may be added by the game while a learner or prefetcher thread samples them
+        self.lock = threading.RLock()
+        self.obses = None
+        if input_shape is not None:
+            self._allocate(input_shape)
+
+    def _allocate(self, input_shape):
+        self.obses = open_memory(self.directory, 'obses', (self.memory_size, *input_shape), np.float32)
+        self.actions = open_memory(self.directory, 'actions', (self.memory_size,), np.int64)
+        self.rewards = open_memory(self.directory, 'rewards', (self.memory_size,), np.float32)
+        self.obses_ = open_memory(self.directory, 'obses_', (self.memory_size, *input_shape), np.float32)
+        self.dones = open_memory(self.directory, 'dones', (self.memory_size,), np.float32)
 
     # add the samples
     def add(self, obs, action, reward, obs_, done):
-        data = (obs, action, reward, obs_, done)
-        if self.next_idx >= len(self.storage):
-            self.storage.append(data)
-        else:
-            self.storage[self.next_idx] = data
-        # get the next idx
-        self.next_idx = (self.next_idx + 1) % self.memory_size
+        with self.lock:
+            if self.obses is None:
+                self._allocate(np.shape(obs))
+            idx = self.next_idx
+            self.obses[idx] = obs
+            self.actions[idx] = action
+            self.rewards[idx] = reward
+            self.obses_[idx] = obs_
+            self.dones[idx] = done
+            # get the next idx
+            self.next_idx = (self.next_idx + 1) % self.memory_size
+            self.size = min(self.size + 1, self.memory_size)
+            self.counters[:] = self.next_idx, self.size
 
     def get_size(self):
-        return len(self.storage)
+        return self.size
 
     # encode samples
     def _encode_sample(self, idx):
-        obses, actions, rewards, obses_, dones = [], [], [], [], []
-        for i in idx:
-            data = self.storage[i]
-            obs, action, reward, obs_, done = data
-            obses.append(np.array(obs, copy=False))
-            actions.append(np.array(action, copy=False))
-            rewards.append(reward)
-            obses_.append(np.array(obs_, copy=False))
-            dones.append(done)
-        return np.array(obses), np.array(actions), np.array(rewards), np.array(obses_), np.array(dones)
+        return self.obses[idx], self.actions[idx], self.rewards[idx], self.obses_[idx], self.dones[idx]
 
     # sample from the memory
     def sample(self, batch_size):
-        idxes = [random.randint(0, len(self.storage) - 1) for _ in range(batch_size)]
-        return self._encode_sample(idxes)
+        with self.lock:
+            idxes = np.random.randint(0, self.size, size=batch_size)
+            return self._encode_sample(idxes)
+
+    def flush(self):
+        # writes the memory mapped files to the disk
+        for memory in [self.counters, self.obses, self.actions, self.rewards, self.obses_, self.dones]:
+            if isinstance(memory, np.memmap):
+                memory.flush()
+
+    def __getstate__(self):
+        # a copy of the buffer (e.g. in a learner process) reopens the memory mapped files instead of copying them
+        state = self.__dict__.copy()
+        del state['lock']
+        state['input_shape'] = None if self.obses is None else self.obses.shape[1:]
+        if self.directory is not None:
+            for name in ['counters', 'obses', 'actions', 'rewards', 'obses_', 'dones']:
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        input_shape = state.pop('input_shape')
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+        if self.directory is not None:
+            self.counters = open_memory(self.directory, 'counters', (2,), np.int64)
+            self.obses = None
+            if input_shape is not None:
+                self._allocate(input_shape)
+
+
+class SumTree:
+    """
+    Binary tree of priorities in an array: the leaves hold the priorities of the items and every node the sum of its
+    children. tree[1] is the total priority, the children of node i are 2i and 2i + 1 and the leaf of item j is
+    capacity + j. Updates and searches take O(log n) and are vectorized over batches of items.
+    """
+    def __init__(self, capacity, directory=None):
+        # a power of two, so that all the leaves are on the same level
+        self.capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.directory = directory
+        self.tree = open_memory(directory, 'priorities', (2 * self.capacity,), np.float64)
+
+    def __getstate__(self):
+        # a copy of the tree reopens its memory mapped file instead of copying it
+        state = self.__dict__.copy()
+        if self.directory is not None:
+            del state['tree']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.directory is not None:
+            self.tree = open_memory(self.directory, 'priorities', (2 * self.capacity,), np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def priorities(self, idxes):
+        return self.tree[idxes + self.capacity]
+
+    def update(self, idxes, priorities):
+        nodes = np.asarray(idxes) + self.capacity
+        self.tree[nodes] = priorities
+        # recompute the sums of the ancestors of the leaves, one level at a time
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        :param values: array of values in [0, total)
+        :return: the items whose cumulative priority ranges contain the values
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values -= np.where(go_right, left_sum, 0)
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer sampling the transitions in proportion to their priority, (|TD error| + epsilon) ^ alpha,
+    with the importance sampling weights that correct for the non uniform sampling.
+    """
+    def __init__(self, memory_size, input_shape=None, directory=None, alpha=0.6, beta=0.4, beta_increment=0.,
+                 epsilon=1e-6):
+        """
+        :param alpha: how much the priorities count, 0 for uniform sampling
+        :param beta: the exponent of the importance sampling weights, 1 fully corrects the sampling bias
+        :param beta_increment: added to beta on every sample, until beta reaches 1
+        :param epsilon: added to the TD errors, so that every transition can be sampled
+        """
+        super(PrioritizedReplayBuffer, self).__init__(memory_size, input_shape, directory)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.tree = SumTree(memory_size, directory)
+        # the new transitions get the max priority, to be sampled at least once
+        self.max_priority = max(self.tree.priorities(np.arange(self.size)).max(initial=0), 1.)
+        # a persistent buffer filled without prioritized replay has no priorities yet: its transitions get the max
+        if self.size > 0 and self.tree.total() == 0:
+            self.tree.update(np.arange(self.size), self.max_priority)
+
+    def add(self, obs, action, reward, obs_, done):
+        with self.lock:
+            idx = self.next_idx
+            super(PrioritizedReplayBuffer, self).add(obs, action, reward, obs_, done)
+            self.tree.update([idx], self.max_priority)
+
+    def sample(self, batch_size):
+        """
+        :return: the sampled transitions, their importance sampling weights and their indices in the buffer
+        """
+        with self.lock:
+            total = self.tree.total()
+            # a value from every one of batch_size equal segments of the total priority
+            values = (np.arange(batch_size) + np.random.rand(batch_size)) * (total / batch_size)
+            idxes = np.minimum(self.tree.find(values), self.size - 1)
+            # the weights are normalized by their max, so that they only scale the updates down
+            weights = (self.size * self.tree.priorities(idxes) / total) ** -self.beta
+            weights /= weights.max()
+            self.beta = min(1., self.beta + self.beta_increment)
+            return self._encode_sample(idxes) + (weights.astype(np.float32), idxes)
+
+    def update_priorities(self, idxes, errors):
+        """
+        :param idxes: the indices of sampled transitions
+        :param errors: their new TD errors
+        """
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        with self.lock:
+            self.max_priority = max(self.max_priority, priorities.max())
+            self.tree.update(idxes, priorities)
+
+    def flush(self):
+        super(PrioritizedReplayBuffer, self).flush()
+        if isinstance(self.tree.tree, np.memmap):
+            self.tree.tree.flush()
 
 
 class Actor(nn.Module):
@@ -93,19 +286,40 @@ class Actor(nn.Module):
         actions_logits = self.actor_mlp(s)
         return F.softmax(actions_logits, dim=-1)
 
+    def to_input(self, s):
+        # a new tensor per call, the actor may decide in several threads (e.g. the game and a PolicyWorker)
+        return torch.as_tensor(np.asarray(s), dtype=torch.float32, device=self.actor_mlp[0].weight.device)
+
     def greedy_act(self, s):  # no softmax more efficient
-        s = torch.from_numpy(s).float().to(device)
-        actions_logits = self.actor_mlp(s)
-        greedy_actions = torch.argmax(actions_logits, dim=-1, keepdim=True)
-        return greedy_actions.item()
+        with torch.no_grad():
+            actions_logits = self.actor_mlp(self.to_input(s))
+            return int(torch.argmax(actions_logits))
 
     def sample_act(self, s):
-        s = torch.from_numpy(s).float().to(device)
-        actions_logits = self.actor_mlp(s)
-        actions_probs = F.softmax(actions_logits, dim=-1)
-        actions_distribution = Categorical(actions_probs)
-        action = actions_distribution.sample()
-        return action.item()
+        with torch.no_grad():
+            actions_logits = self.actor_mlp(self.to_input(s))
+            actions_probs = F.softmax(actions_logits, dim=-1)
+            # the same draw from torch's random numbers as Categorical(actions_probs).sample()
+            return int(torch.multinomial(actions_probs, 1, True))
+
+    def greedy_acts(self, states):
+        """
+        :param states: (N, state_dim) array of states, e.g. of N games
+        :return: (N,) array of the greedy actions, from a single forward pass
+        """
+        with torch.no_grad():
+            actions_logits = self.actor_mlp(self.to_input(states))
+            return torch.argmax(actions_logits, dim=-1).cpu().numpy()
+
+    def sample_acts(self, states):
+        """
+        :param states: (N, state_dim) array of states, e.g. of N games
+        :return: (N,) array of the sampled actions, from a single forward pass
+        """
+        with torch.no_grad():
+            actions_logits = self.actor_mlp(self.to_input(states))
+            actions_probs = F.softmax(actions_logits, dim=-1)
+            return torch.multinomial(actions_probs, 1, True).squeeze(1).cpu().numpy()
 
     def save_checkpoint(self):
         torch.save(self.state_dict(), self.checkpoint_file)
@@ -114,6 +328,45 @@ class Actor(nn.Module):
         self.load_state_dict(torch.load(self.checkpoint_file))
 
 
+class NumpyActor:
+    """
+    NumPy copy of the weights of an Actor, to decide the actions of the game without the overhead of torch and
+    autograd on a single state. load copies the current weights of an actor into the same arrays. greedy_acts and
+    sample_acts decide the actions of a batch of states.
+    """
+    def __init__(self, actor):
+        self.layers = [(layer.weight.detach().cpu().numpy().T.copy(), layer.bias.detach().cpu().numpy().copy())
+                       for layer in actor.actor_mlp if isinstance(layer, nn.Linear)]
+
+    def load(self, actor):
+        linear_layers = [layer for layer in actor.actor_mlp if isinstance(layer, nn.Linear)]
+        for (weight, bias), layer in zip(self.layers, linear_layers):
+            np.copyto(weight, layer.weight.detach().cpu().numpy().T)
+            np.copyto(bias, layer.bias.detach().cpu().numpy())
+
+    def logits(self, s):
+        hidden = np.asarray(s, dtype=np.float32)
+        for weight, bias in self.layers[:-1]:
+            hidden = np.maximum(hidden @ weight + bias, 0)
+        weight, bias = self.layers[-1]
+        return hidden @ weight + bias
+
+    def greedy_act(self, s):
+        return int(np.argmax(self.logits(s)))
+
+    def sample_act(self, s):
+        actions_logits = self.logits(s)
+        # softmax, without the normalization
+        return sample_categorical(np.exp(actions_logits - actions_logits.max()))
+
+    def greedy_acts(self, states):
+        return np.argmax(self.logits(states), axis=-1)
+
+    def sample_acts(self, states):
+        actions_logits = self.logits(states)
+        return sample_categoricals(np.exp(actions_logits - actions_logits.max(axis=-1, keepdims=True)))
+
+
 class Critic(nn.Module):
     def __init__(self, state_dim, action_dim, n_hidden_units, name='critic', chkpt_dir='tmp/sac'):
         super(Critic, self).__init__()
@@ -0,0 +1,79 @@
+import threading
+
+
+class PolicyWorker:
+    """
+    Computes the agent's next action in a background thread from the latest observation of the game, published on
+    every physics tick, and latches it, so that the game reads the most recent action instead of waiting for the agent.
+    The staleness of every action read, the physics ticks between its observation and the read, is kept in staleness.
+    """
+    def __init__(self, decide):
+        """
+        :param decide: function returning the agent's action for an observation. it is only called by the worker
+        """
+        self.decide = decide
+        self.condition = threading.Condition()
+        # the latest observation, its tick and its number
+        self.observation, self.observation_tick, self.observed = None, None, 0
+        # the latched action, the tick and number of its observation
+        self.action, self.action_tick, self.computed = None, None, 0
+        self.staleness = []
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def observe(self, observation, tick):
+        """
+        Publishes the latest observation of the game.
+        :param observation: the observation. it must not be changed after
+        :param tick: the physics tick of the game at the observation
+        """
+        with self.condition:
+            self.observation, self.observation_tick = observation, tick
+            self.observed += 1
+            self.condition.notify_all()
+
+    def get_action(self, observation, tick):
+        """
+        Reads the latched action. At the start of a game, when no action has been latched for it, waits for the
+        action of the current observation.
+        :param observation: the current observation of the game
+        :param tick: the current physics tick of the game
+        :return: the agent's action
+        """
+        with self.condition:
+            if self.action_tick is None or tick == 0 or self.action_tick > tick:
+                self.observe(observation, tick)
+                observed = self.observed
+                self.condition.wait_for(lambda: self.computed >= observed or self.error is not None)
+            if self.error is not None:
+                raise self.error
+            self.staleness.append(tick - self.action_tick)
+            return self.action
+
+    def close(self):
+        """Stops the worker thread"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or self.observed > self.computed)
+                if self.closed:
+                    return
+                observation, tick, observed = self.observation, self.observation_tick, self.observed
+            try:
+                action = self.decide(observation)
+            except Exception as error:
+                # raised by get_action in the game's thread
+                with self.condition:
+                    self.error = error
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                self.action, self.action_tick, self.computed = action, tick, observed
+                self.condition.notify_all()
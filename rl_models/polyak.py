@@ -0,0 +1,42 @@
+import torch
+
+
+def flatten_parameters(module):
+    """
+    Moves the parameters of a module into a single contiguous tensor and makes them views of it, so that an operation
+    on all the parameters is a single operation on that tensor. The module must not be moved to another device after.
+    :param module: the network
+    :return: the flat tensor of the parameters
+    """
+    parameters = list(module.parameters())
+    flat = torch.cat([parameter.detach().reshape(-1) for parameter in parameters])
+    offset = 0
+    for parameter in parameters:
+        parameter.data = flat[offset:offset + parameter.numel()].view_as(parameter)
+        offset += parameter.numel()
+    return flat
+
+
+class PolyakAverager:
+    """
+    Soft updates of a target network towards a network with the same architecture:
+        target = tau * network + (1 - tau) * target
+    The parameters of both networks are flattened, so an update is two in-place operations that allocate nothing.
+    """
+    def __init__(self, network, target, tau):
+        """
+        :param network: the trained network
+        :param target: its target network
+        :param tau: the default weight of the network in an update
+        """
+        self.parameters = flatten_parameters(network)
+        self.target_parameters = flatten_parameters(target)
+        self.tau = tau
+
+    def update(self, tau=None):
+        """
+        :param tau: the weight of the network. if None, the default tau. 1 copies the network to the target
+        """
+        tau = self.tau if tau is None else tau
+        with torch.no_grad():
+            self.target_parameters.mul_(1 - tau).add_(self.parameters, alpha=tau)
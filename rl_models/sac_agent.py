@@ -4,6 +4,7 @@ import torch.nn.functional as F
 import numpy as np
 from rl_models.buffer import ReplayBuffer
 from rl_models.networks import ActorNetwork, CriticNetwork, ValueNetwork
+from rl_models.polyak import PolyakAverager
 
 if T.cuda.is_available():
     print("Using GPU")
@@ -15,7 +16,7 @@ class Agent():
     def __init__(self, config=None, alpha=0.0003, beta=0.0003, input_dims=[8],
                  env=None, gamma=0.99, n_actions=2, max_size=1000000, tau=0.005,
                  update_interval=1, layer1_size=256, layer2_size=256, batch_size=256, reward_scale=2,
-                 chkpt_dir='tmp/sac'):
+                 chkpt_dir='tmp/sac', buffer_dir=None):
         if config is not None:
             # SAC params
             self.batch_size = config['SAC']['batch_size']
@@ -50,7 +51,7 @@ class Agent():
         if config is not None and 'chkpt_dir' in config["Experiment"].values():
             self.chkpt_dir = config['chkpt_dir']
 
-        self.memory = ReplayBuffer(self.buffer_max_size, self.input_dims, self.n_actions)
+        self.memory = ReplayBuffer(self.buffer_max_size, self.input_dims, self.n_actions, directory=buffer_dir)
         self.actor = ActorNetwork(self.alpha, self.input_dims, n_actions=self.n_actions,
                                   name='actor', max_action=self.env.action_space.high+1,
                                   fc1_dims=self.layer1_size, fc2_dims=self.layer2_size,
@@ -66,6 +67,7 @@ class Agent():
                                   chkpt_dir=self.chkpt_dir)
         self.target_value = ValueNetwork(self.beta, self.input_dims, name='target_value', fc1_dims=self.layer1_size,
                                          fc2_dims=self.layer2_size, chkpt_dir=self.chkpt_dir)
+        self.target_value_averager = PolyakAverager(self.value, self.target_value, self.tau)
         self.update_network_parameters(tau=self.tau)
 
     def choose_action(self, observation):
@@ -74,24 +76,21 @@ class Agent():
 
         return actions.cpu().detach().numpy()[0]
 
+    def choose_actions(self, observations):
+        """
+        :param observations: (N, input_dims) array of observations, e.g. of N games
+        :return: (N, n_actions) array of the sampled actions, from a single forward pass
+        """
+        state = T.as_tensor(np.asarray(observations), dtype=T.float).to(self.actor.device)
+        with T.no_grad():
+            actions, _ = self.actor.sample_normal(state, reparameterize=False)
+        return actions.cpu().numpy()
+
     def remember(self, state, action, reward, new_state, done):
         self.memory.store_transition(state, action, reward, new_state, done)
 
     def update_network_parameters(self, tau=None):
-        if tau is None:
-            tau = self.tau
-
-        target_value_params = self.target_value.named_parameters()
-        value_params = self.value.named_parameters()
-
-        target_value_state_dict = dict(target_value_params)
-        value_state_dict = dict(value_params)
-
-        for name in value_state_dict:
-            value_state_dict[name] = tau * value_state_dict[name].clone() + \
-                                     (1 - tau) * target_value_state_dict[name].clone()
-
-        self.target_value.load_state_dict(value_state_dict)
+        self.target_value_averager.update(tau)
 
     def save_models(self):
         print('.... saving models ....')
@@ -100,6 +99,7 @@ class Agent():
         self.target_value.save_checkpoint()
         self.critic_1.save_checkpoint()
         self.critic_2.save_checkpoint()
+        self.memory.flush()
 
     def load_models(self):
         print('.... loading models ....')
@@ -109,24 +109,44 @@ class Agent():
         self.critic_1.load_checkpoint()
         self.critic_2.load_checkpoint()
 
-    def learn(self, episode=None):
+    def to_tensors(self, state, action, reward, new_state, done):
+        reward = T.tensor(reward, dtype=T.float).to(self.actor.device)
+        done = T.tensor(done).to(self.actor.device)
+        state_ = T.tensor(new_state, dtype=T.float).to(self.actor.device)
+        state = T.tensor(state, dtype=T.float).to(self.actor.device)
+        action = T.tensor(action, dtype=T.float).to(self.actor.device)
+        return state, action, reward, state_, done
+
+    def learn_many(self, k):
+        """
+        Performs k offline gradient updates, as k calls to learn. The k mini-batches are sampled with a single call
+        and converted to tensors at once, then every update uses a slice of them.
+        :param k: the number of gradient updates
+        """
+        if self.memory.mem_cntr < self.batch_size:
+            return
+        batches = self.to_tensors(*self.memory.sample_buffer(k * self.batch_size))
+        for start in range(0, k * self.batch_size, self.batch_size):
+            self.learn(batch=tuple(column[start:start + self.batch_size] for column in batches))
+
+    def learn(self, episode=None, batch=None):
+        """
+        :param episode: a single transition to learn from (online training)
+        :param batch: a mini-batch of tensors from to_tensors. if None, it is sampled from the replay buffer
+        """
         if episode is not None:  # online training
             state, action, reward, new_state, done = episode
             state = np.asarray([state])
             action = np.asarray([action])
             new_state = np.asarray([new_state])
+            batch = self.to_tensors(state, action, reward, new_state, done)
 
-        else:  # offline training
+        elif batch is None:  # offline training
             if self.memory.mem_cntr < self.batch_size:
                 return
-            state, action, reward, new_state, done = \
-                self.memory.sample_buffer(self.batch_size)
+            batch = self.to_tensors(*self.memory.sample_buffer(self.batch_size))
 
-        reward = T.tensor(reward, dtype=T.float).to(self.actor.device)
-        done = T.tensor(done).to(self.actor.device)
-        state_ = T.tensor(new_state, dtype=T.float).to(self.actor.device)
-        state = T.tensor(state, dtype=T.float).to(self.actor.device)
-        action = T.tensor(action, dtype=T.float).to(self.actor.device)
+        state, action, reward, state_, done = batch
 
         value = self.value(state).view(-1)
         value_ = self.target_value(state_).view(-1)
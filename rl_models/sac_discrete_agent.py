@@ -1,6 +1,7 @@
 import torch
 import numpy as np
-from rl_models.networks_discrete import update_params, Actor, Critic, ReplayBuffer
+from rl_models.networks_discrete import update_params, Actor, Critic, ReplayBuffer, PrioritizedReplayBuffer
+from rl_models.polyak import PolyakAverager
 import torch.nn.functional as F
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -10,7 +11,8 @@ class DiscreteSACAgent:
     def __init__(self, config=None, alpha=0.0003, beta=0.0003, input_dims=[8],
                  env=None, gamma=0.99, n_actions=2, buffer_max_size=1000000, tau=0.005,
                  update_interval=1, layer1_size=256, layer2_size=256, batch_size=256, reward_scale=2,
-                 chkpt_dir=None, target_entropy_ratio=0.4):
+                 chkpt_dir=None, target_entropy_ratio=0.4, buffer_dir=None, prioritized_replay=False, per_alpha=0.6,
+                 per_beta=0.4, per_beta_increment=0.):
         if config is not None:
             # SAC params
             self.batch_size = config['SAC']['batch_size']
@@ -21,6 +23,11 @@ class DiscreteSACAgent:
             self.alpha = config['SAC']['alpha']
             self.beta = config['SAC']['beta']
             self.target_entropy = config['SAC']['target_entropy_ratio']
+            # prioritized experience replay
+            prioritized_replay = config['SAC'].get('prioritized_replay', prioritized_replay)
+            per_alpha = config['SAC'].get('per_alpha', per_alpha)
+            per_beta = config['SAC'].get('per_beta', per_beta)
+            per_beta_increment = config['SAC'].get('per_beta_increment', per_beta_increment)
         else:
             self.gamma = gamma
             self.tau = tau
@@ -34,6 +41,8 @@ class DiscreteSACAgent:
         self.buffer_max_size = buffer_max_size
         self.scale = reward_scale
         self.lr = 0.002
+        # the max norm of the gradients of the actor and the critic. None to not clip them
+        self.max_grad_norm = 5
         self.env = env
         self.input_dims = input_dims[0]
         self.n_actions = n_actions
@@ -50,6 +59,7 @@ class DiscreteSACAgent:
 
         self.target_critic.load_state_dict(self.critic.state_dict())
         # self.soft_update_target()
+        self.target_averager = PolyakAverager(self.critic, self.target_critic, self.tau)
 
         # disable gradient for target critic
         # for param in self.target_critic.parameters():
@@ -67,50 +77,114 @@ class DiscreteSACAgent:
         self.log_alpha = torch.zeros(1, requires_grad=True, device=device)
         self.alpha_optim = torch.optim.Adam([self.log_alpha], lr=self.lr, eps=1e-4)
 
-        self.memory = ReplayBuffer(self.buffer_max_size)
-
-    def learn(self, interaction=None):
-        if interaction is None:
-            states, actions, rewards, states_, dones = self.memory.sample(self.batch_size)
+        self.prioritized_replay = prioritized_replay
+        if self.prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(self.buffer_max_size, (self.input_dims,), directory=buffer_dir,
+                                                  alpha=per_alpha, beta=per_beta, beta_increment=per_beta_increment)
         else:
-            states, actions, rewards, states_, dones = interaction
-            states, actions, rewards, states_, dones = [np.asarray([states]), np.asarray([actions]),
-                                                        np.asarray([rewards]), np.asarray([states_]),
-                                                        np.asarray([dones])]
+            self.memory = ReplayBuffer(self.buffer_max_size, (self.input_dims,), directory=buffer_dir)
+
+    def __getstate__(self):
+        # a copy of the agent (e.g. in a learner process) does not play, so the environment and its window stay here
+        state = self.__dict__.copy()
+        state['env'] = None
+        return state
+
+    def sample_batch(self):
+        """
+        Samples a mini-batch from the replay buffer.
+        :return: the states, actions, rewards, next states and dones as tensors on the device, the importance sampling
+        weights (1. without prioritized replay) and the indices of the transitions (None without prioritized replay)
+        """
+        if self.prioritized_replay:
+            states, actions, rewards, states_, dones, weights, idxes = self.memory.sample(self.batch_size)
+            weights = torch.from_numpy(weights).to(device).unsqueeze(1)  # dim [Batch,] -> [Batch, 1]
+        else:
+            states, actions, rewards, states_, dones = self.memory.sample(self.batch_size)
+            weights, idxes = 1., None
+        return self.to_tensors(states, actions, rewards, states_, dones) + (weights, idxes)
+
+    def sample_batches(self, k):
+        """
+        Samples k mini-batches from the uniform replay buffer with a single call.
+        :return: the states, actions, rewards, next states and dones of the k mini-batches one after the other, as
+        tensors on the device
+        """
+        return self.to_tensors(*self.memory.sample(k * self.batch_size))
+
+    def to_tensors(self, states, actions, rewards, states_, dones):
         states = torch.from_numpy(states).float().to(device)
         states_ = torch.from_numpy(states_).float().to(device)
-        actions = torch.tensor(actions, dtype=torch.long).to(device).unsqueeze(1)  # dim [Batch,] -> [Batch, 1]
+        actions = torch.as_tensor(actions, dtype=torch.long).to(device).unsqueeze(1)  # dim [Batch,] -> [Batch, 1]
         # rewards = (rewards - rewards.mean()) / (rewards.std() + 1e-5)
-        rewards = torch.tensor(rewards).float().to(device)
-        dones = torch.tensor(dones).float().to(device)
+        rewards = torch.as_tensor(rewards).float().to(device)
+        dones = torch.as_tensor(dones).float().to(device)
+        return states, actions, rewards, states_, dones
+
+    def learn(self, interaction=None, batch=None):
+        """
+        Performs a gradient update of the networks.
+        :param interaction: a single transition to learn from, instead of a mini-batch
+        :param batch: a mini-batch from sample_batch (e.g. prefetched). if None, it is sampled from the replay buffer
+        """
+        if interaction is not None:
+            states, actions, rewards, states_, dones = interaction
+            batch = self.to_tensors(np.asarray([states]), np.asarray([actions]), np.asarray([rewards]),
+                                    np.asarray([states_]), np.asarray([dones])) + (1., None)
+        elif batch is None:
+            batch = self.sample_batch()
+        states, actions, rewards, states_, dones, weights, idxes = batch
 
         batch_transitions = states, actions, rewards, states_, dones
 
-        weights = 1.  # default
-        q1_loss, q2_loss, errors, mean_q1, mean_q2 = self.calc_critic_loss(batch_transitions, weights)
-        policy_loss, entropies = self.calc_policy_loss(batch_transitions, weights)
+        # a single forward pass of the critic on the states for both the critic and the policy loss
+        q1, q2 = self.critic(states)
+        q1_loss, q2_loss, errors, mean_q1, mean_q2 = self.calc_critic_loss(batch_transitions, weights, q1, q2)
+        if idxes is not None:
+            self.memory.update_priorities(idxes, errors.squeeze(1).cpu().numpy())
+        # the policy loss does not train the critic
+        policy_loss, entropies = self.calc_policy_loss(batch_transitions, weights, q1.detach(), q2.detach())
         entropy_loss = self.calc_entropy_loss(entropies, weights)
 
-        torch.nn.utils.clip_grad_norm_(self.critic.parameters(), 5)
-        update_params(self.critic_q1_optim, q1_loss)
-        update_params(self.critic_q2_optim, q2_loss)
-        torch.nn.utils.clip_grad_norm_(self.actor.parameters(), 5)
-        update_params(self.actor_optim, policy_loss)
+        # the losses have separate graphs, each freed by its backward pass. the Q-networks have separate parameters,
+        # so the gradients of their summed losses are those of each loss
+        update_params([self.critic_q1_optim, self.critic_q2_optim], q1_loss + q2_loss, self.critic.parameters(),
+                      self.max_grad_norm)
+        update_params(self.actor_optim, policy_loss, self.actor.parameters(), self.max_grad_norm)
         update_params(self.alpha_optim, entropy_loss)
 
         return mean_q1, mean_q2, entropies
 
+    def learn_many(self, k, batches=None):
+        """
+        Performs k gradient updates, each followed by a soft update of the target critic, as k calls to learn and
+        soft_update_target. The k mini-batches of uniform replay are sampled at once and every update uses a slice of
+        them. With prioritized replay every mini-batch is sampled after the previous update, that changes the
+        priorities.
+        :param k: the number of gradient updates
+        :param batches: the k mini-batches from sample_batches (e.g. prefetched). if None, they are sampled from the
+        uniform replay buffer
+        """
+        if self.prioritized_replay:
+            for _ in range(k):
+                self.learn()
+                self.soft_update_target()
+            return
+        if batches is None:
+            batches = self.sample_batches(k)
+        for start in range(0, k * self.batch_size, self.batch_size):
+            self.learn(batch=tuple(column[start:start + self.batch_size] for column in batches) + (1., None))
+            self.soft_update_target()
+
     def update_target(self):
         self.target_critic.load_state_dict(self.critic.state_dict())
 
     def soft_update_target(self):
-        for target_param, param in zip(self.target_critic.parameters(), self.critic.parameters()):
-            target_param.data.copy_(self.tau * param + (1 - self.tau) * target_param)
+        self.target_averager.update()
 
-    def calc_current_q(self, states, actions, rewards, next_states, dones):
-        curr_q1, curr_q2 = self.critic(states)
-        curr_q1 = curr_q1.gather(1, actions)  # select the Q corresponding to chosen A
-        curr_q2 = curr_q2.gather(1, actions)
+    def calc_current_q(self, actions, q1, q2):
+        curr_q1 = q1.gather(1, actions)  # select the Q corresponding to chosen A
+        curr_q2 = q2.gather(1, actions)
         return curr_q1, curr_q2
 
     def calc_target_q(self, states, actions, rewards, next_states, dones):
@@ -134,12 +208,12 @@ class DiscreteSACAgent:
         # assert rewards.shape == next_q.shape
         # return rewards + (1.0 - dones) * self.gamma * next_q
 
-    def calc_critic_loss(self, batch, weights):
+    def calc_critic_loss(self, batch, weights, q1, q2):
         target_q = self.calc_target_q(*batch)
+        curr_q1, curr_q2 = self.calc_current_q(batch[1], q1, q2)
 
         # TD errors for updating priority weights
-        # errors = torch.abs(curr_q1.detach() - target_q)
-        errors = None
+        errors = torch.abs(curr_q1.detach() - target_q)
         mean_q1, mean_q2 = None, None
 
         # We log means of Q to monitor training.
@@ -147,15 +221,12 @@ class DiscreteSACAgent:
         # mean_q2 = curr_q2.detach().mean().item()
 
         # Critic loss is mean squared TD errors with priority weights.
-        # q1_loss = torch.mean((curr_q1 - target_q).pow(2) * weights)
-        # q2_loss = torch.mean((curr_q2 - target_q).pow(2) * weights)
-        curr_q1, curr_q2 = self.calc_current_q(*batch)
-        q1_loss = F.mse_loss(curr_q1, target_q)
-        q2_loss = F.mse_loss(curr_q2, target_q)
+        q1_loss = torch.mean((curr_q1 - target_q).pow(2) * weights)
+        q2_loss = torch.mean((curr_q2 - target_q).pow(2) * weights)
 
         return q1_loss, q2_loss, errors, mean_q1, mean_q2
 
-    def calc_policy_loss(self, batch, weights):
+    def calc_policy_loss(self, batch, weights, q1, q2):
         states, actions, rewards, next_states, dones = batch
 
         # (Log of) probabilities to calculate expectations of Q and entropies.
@@ -168,15 +239,16 @@ class DiscreteSACAgent:
         # q1, q2 = self.critic(states)
         # q = torch.min(q1, q2)
 
-        q1, q2 = self.critic(states)
+        # q1, q2: the Q values of the states, without the critic's graph
 
-        alpha = self.log_alpha.exp()
+        # the policy loss does not train alpha
+        alpha = self.log_alpha.exp().detach()
         # minq = torch.min(q1, q2)
         # inside_term = alpha * log_action_probs - minq
         # policy_loss = (action_probs * inside_term).mean()
 
         # Expectations of entropies.
-        entropies = - torch.sum(action_probs * log_action_probs, dim=1)
+        entropies = - torch.sum(action_probs * log_action_probs, dim=1, keepdim=True)
         # Expectations of Q.
         q = torch.sum(torch.min(q1, q2) * action_probs, dim=1, keepdim=True)
 
@@ -208,6 +280,7 @@ class DiscreteSACAgent:
             self.actor.save_checkpoint()
             self.critic.save_checkpoint()
             self.target_critic.save_checkpoint()
+            self.memory.flush()
 
     def load_models(self):
         print('.... loading models ....')
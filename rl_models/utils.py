@@ -1,9 +1,15 @@
+import os
+
 from rl_models.sac_agent import Agent
 from rl_models.sac_discrete_agent import DiscreteSACAgent
 
 
 def get_sac_agent(config, env, chkpt_dir=None):
     discrete = config['SAC']['discrete']
+    # keep the replay buffer on the disk, in the checkpoint directory, to resume it with the checkpoint
+    buffer_dir = None
+    if config['SAC'].get('persistent_buffer', False) and chkpt_dir is not None:
+        buffer_dir = os.path.join(chkpt_dir, 'replay_buffer')
     if discrete:
         if config['Experiment']['mode'] == 'max_games_mode':
             buffer_max_size = config['Experiment']['max_games_mode']['buffer_memory_size']
@@ -25,8 +31,8 @@ def get_sac_agent(config, env, chkpt_dir=None):
         sac = DiscreteSACAgent(config=config, env=env, input_dims=env.observation_shape,
                                n_actions=action_dim,
                                chkpt_dir=chkpt_dir, buffer_max_size=buffer_max_size, update_interval=update_interval,
-                               reward_scale=scale)
+                               reward_scale=scale, buffer_dir=buffer_dir)
     else:
         sac = Agent(config=config, env=env, input_dims=env.observation_shape, n_actions=env.action_space.shape,
-                    chkpt_dir=chkpt_dir)
+                    chkpt_dir=chkpt_dir, buffer_dir=buffer_dir)
     return sac
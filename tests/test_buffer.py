@@ -0,0 +1,147 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from rl_models import buffer
+from rl_models.networks_discrete import ReplayBuffer, PrioritizedReplayBuffer, SumTree
+
+
+def add_transitions(memory, count, seed=0):
+    """
+    :return: the transitions added, in order
+    """
+    rng = np.random.RandomState(seed)
+    transitions = []
+    for _ in range(count):
+        transition = (rng.uniform(-1, 1, 8).astype(np.float32), rng.randint(3), np.float32(rng.uniform(-1, 1)),
+                      rng.uniform(-1, 1, 8).astype(np.float32), float(rng.rand() < 0.1))
+        memory.add(*transition)
+        transitions.append(transition)
+    return transitions
+
+
+def test_open_memory_reopens_its_file(tmp_path):
+    memory = buffer.open_memory(str(tmp_path), 'rewards', (4,), np.float32)
+    memory[:] = [1, 2, 3, 4]
+    memory.flush()
+    del memory
+    np.testing.assert_array_equal(buffer.open_memory(str(tmp_path), 'rewards', (4,), np.float32), [1, 2, 3, 4])
+    with pytest.raises(ValueError):
+        buffer.open_memory(str(tmp_path), 'rewards', (5,), np.float32)
+
+
+def test_replay_buffer_reopens_after_restart(tmp_path):
+    memory = ReplayBuffer(10, (8,), directory=str(tmp_path))
+    # wraps around the ring
+    transitions = add_transitions(memory, 13)
+    memory.flush()
+    del memory
+
+    # the next run reopens the buffer with its transitions and carries on where it stopped
+    memory = ReplayBuffer(10, (8,), directory=str(tmp_path))
+    assert memory.get_size() == 10 and memory.next_idx == 3
+    obses, actions, rewards, obses_, dones = memory._encode_sample(np.arange(10))
+    # the 3 last transitions overwrote the 3 first
+    expected = transitions[10:] + transitions[3:10]
+    np.testing.assert_array_equal(obses, [transition[0] for transition in expected])
+    np.testing.assert_array_equal(actions, [transition[1] for transition in expected])
+    np.testing.assert_array_equal(rewards, [transition[2] for transition in expected])
+    np.testing.assert_array_equal(obses_, [transition[3] for transition in expected])
+    np.testing.assert_array_equal(dones, [transition[4] for transition in expected])
+
+    add_transitions(memory, 1, seed=1)
+    assert memory.next_idx == 4 and memory.get_size() == 10
+
+
+def test_continuous_replay_buffer_reopens_after_restart(tmp_path):
+    memory = buffer.ReplayBuffer(10, (8,), 2, directory=str(tmp_path))
+    for i in range(4):
+        memory.store_transition(np.full(8, i), [i, -i], i, np.full(8, i + 1), i == 3)
+    memory.flush()
+    del memory
+
+    memory = buffer.ReplayBuffer(10, (8,), 2, directory=str(tmp_path))
+    assert memory.mem_cntr == 4
+    np.testing.assert_array_equal(memory.action_memory[:4], [[i, -i] for i in range(4)])
+    np.testing.assert_array_equal(memory.terminal_memory[:4], [False, False, False, True])
+
+
+def test_replay_buffer_copy_reopens_its_files(tmp_path):
+    memory = PrioritizedReplayBuffer(10, (8,), directory=str(tmp_path))
+    add_transitions(memory, 3)
+    # e.g. the copy of a learner process
+    copy = pickle.loads(pickle.dumps(memory))
+    assert isinstance(copy.obses, np.memmap) and isinstance(copy.tree.tree, np.memmap)
+    assert copy.get_size() == 3 and copy.tree.total() == 3
+    transition = add_transitions(copy, 1, seed=1)[0]
+    # the copy writes the files of the buffer
+    np.testing.assert_array_equal(memory.obses[3], transition[0])
+    assert memory.counters.tolist() == [4, 4] and memory.tree.total() == 4
+
+
+def test_replay_buffer_in_ram():
+    memory = ReplayBuffer(10)
+    add_transitions(memory, 3)
+    assert not isinstance(memory.obses, np.memmap) and memory.get_size() == 3
+
+
+def test_sum_tree_total_and_find():
+    tree = SumTree(5)
+    # rounded up to a power of two
+    assert tree.capacity == 8
+    tree.update(np.arange(5), [1., 2., 3., 4., 0.])
+    assert tree.total() == 10
+    # the cumulative priority ranges: [0, 1) [1, 3) [3, 6) [6, 10)
+    np.testing.assert_array_equal(tree.find([0., 0.99, 1., 2.5, 3., 9.99]), [0, 0, 1, 1, 2, 3])
+    tree.update([1, 3], [0., 6.])
+    assert tree.total() == 10
+    np.testing.assert_array_equal(tree.priorities(np.arange(5)), [1., 0., 3., 6., 0.])
+    np.testing.assert_array_equal(tree.find([0.5, 1.5, 4.5]), [0, 2, 3])
+
+
+def test_sum_tree_sampling_is_proportional():
+    rng = np.random.RandomState(0)
+    priorities = np.array([1., 2., 3., 4.])
+    tree = SumTree(len(priorities))
+    tree.update(np.arange(len(priorities)), priorities)
+    items = tree.find(rng.uniform(0, tree.total(), 100000))
+    frequencies = np.bincount(items, minlength=len(priorities)) / len(items)
+    np.testing.assert_allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+
+
+def test_prioritized_replay_update_priorities():
+    np.random.seed(0)
+    memory = PrioritizedReplayBuffer(16, (8,), alpha=1., beta=0.5, epsilon=0.)
+    add_transitions(memory, 4)
+    # the new transitions get the max priority
+    np.testing.assert_array_equal(memory.tree.priorities(np.arange(4)), [1., 1., 1., 1.])
+
+    memory.update_priorities(np.array([0, 1, 2, 3]), np.array([-0.5, 0.5, 1.5, 0.]))
+    np.testing.assert_array_equal(memory.tree.priorities(np.arange(4)), [0.5, 0.5, 1.5, 0.])
+    assert memory.tree.total() == 2.5 and memory.max_priority == 1.5
+    # the next transition gets the new max priority
+    add_transitions(memory, 1, seed=1)
+    assert memory.tree.priorities(np.array([4]))[0] == 1.5
+
+    obses, actions, rewards, obses_, dones, weights, idxes = memory.sample(1000)
+    # a transition with priority 0 is never sampled, the others in proportion to their priority
+    frequencies = np.bincount(idxes, minlength=5) / len(idxes)
+    np.testing.assert_allclose(frequencies, [0.125, 0.125, 0.375, 0., 0.375], atol=0.01)
+    # the weights correct the sampling: (size * probability) ^ -beta, normalized by their max
+    probabilities = memory.tree.priorities(idxes) / memory.tree.total()
+    np.testing.assert_allclose(weights, (probabilities / probabilities.min()) ** -0.5, rtol=1e-6)
+
+
+def test_prioritized_replay_over_a_uniform_buffer(tmp_path):
+    memory = ReplayBuffer(10, (8,), directory=str(tmp_path))
+    add_transitions(memory, 4)
+    memory.flush()
+    del memory
+
+    # turning prioritized replay on for the persistent buffer of a previous run
+    memory = PrioritizedReplayBuffer(10, (8,), directory=str(tmp_path))
+    np.testing.assert_array_equal(memory.tree.priorities(np.arange(10)), [1.] * 4 + [0.] * 6)
+    obses, actions, rewards, obses_, dones, weights, idxes = memory.sample(100)
+    assert set(idxes) == {0, 1, 2, 3}
+    np.testing.assert_array_equal(weights, np.ones(100))
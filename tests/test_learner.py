@@ -0,0 +1,44 @@
+import os
+import threading
+import types
+from unittest import mock
+
+import numpy as np
+import torch
+
+from rl_models.learner import ProcessLearner
+from rl_models.sac_discrete_agent import DiscreteSACAgent
+from test_maze3d_env import make_env
+
+
+def test_process_learner_with_the_game_window(tmp_path):
+    env, clock = make_env()
+    # like a real window, the renderer cannot be copied to another process
+    env.renderer.window = threading.Lock()
+    agent = DiscreteSACAgent(config=env.config, env=env, input_dims=env.observation_shape, n_actions=4,
+                             chkpt_dir=str(tmp_path), buffer_max_size=1000)
+    initial = [parameter.detach().clone() for parameter in agent.actor.parameters()]
+    # the display of the game is open
+    pygame = types.SimpleNamespace(display=types.SimpleNamespace(get_init=lambda: True))
+    with mock.patch.dict('sys.modules', {'pygame': pygame}):
+        learner = ProcessLearner(agent, chunk=100)
+    try:
+        rng = np.random.RandomState(0)
+        for _ in range(300):
+            learner.add(rng.uniform(-1, 1, 8), rng.randint(4), rng.uniform(-1, 1), rng.uniform(-1, 1, 8), False)
+        learner.learn(150)
+        learner.wait()
+        # the updates are done, the next decisions use their weights
+        assert learner.sync_policy() == 2
+        learner.save_models()
+    finally:
+        learner.close()
+
+    assert env.renderer.window is not None and agent.env is env
+    # the weights of the 2 chunks of updates were published and copied into the agent
+    assert learner.policy_version == learner.version.value == 2 and learner.busy_time > 0
+    assert not all(torch.equal(before, after) for before, after in zip(initial, agent.actor.parameters()))
+    # the learner process saved the same final weights
+    saved = torch.load(os.path.join(str(tmp_path), 'actor_sac'))
+    for name, parameter in agent.actor.state_dict().items():
+        torch.testing.assert_close(parameter, saved[name], rtol=0, atol=0)
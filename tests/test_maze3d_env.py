@@ -0,0 +1,153 @@
+import os
+import sys
+import types
+from unittest import mock
+
+import numpy as np
+import pytest
+import yaml
+
+from maze3D_new import Maze3DEnv
+from maze3D_new.Maze3DEnv import Maze3D
+
+config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'game', 'config',
+                           'config_sac_28K_O-a.yaml')
+# an action of 200ms lasts 12 physics ticks at 60 fps
+action_duration, action_ticks = 0.2, 12
+
+
+class Clock:
+    """Replaces time.time in Maze3DEnv, advanced only by FakeRenderer.tick"""
+    def __init__(self):
+        self.now = 1000.
+
+    def time(self):
+        return self.now
+
+
+class FakeRenderer:
+    """The game window: tick waits for the next frame by advancing the clock"""
+    clock = None
+
+    def __init__(self, board):
+        pass
+
+    def set_board(self, board):
+        pass
+
+    def render(self, mode=0, idx=0):
+        pass
+
+    def tick(self, fps):
+        self.clock.now += 1 / fps
+        return fps
+
+    def get_keyboard(self, actions, discrete_input):
+        return 0, actions
+
+    def close(self):
+        pass
+
+
+def make_env(**game):
+    """
+    :param game: the settings of the game section of the config
+    :return: the game, with a fake window and clock unless headless
+    """
+    with open(config_file) as file:
+        config = yaml.safe_load(file)
+    config['game'].update(agent_only=True, **game)
+    clock = Clock()
+    FakeRenderer.clock = clock
+    renderer_module = types.ModuleType('maze3D_new.renderer')
+    renderer_module.Renderer = FakeRenderer
+    with mock.patch.dict(sys.modules, {'maze3D_new.renderer': renderer_module}):
+        env = Maze3D(config=config)
+    env.reset()
+    return env, clock
+
+
+def action_ticks_of(env, clock):
+    """
+    :return: the physics ticks of an action
+    """
+    with mock.patch.object(Maze3DEnv, 'time', types.SimpleNamespace(time=clock.time, sleep=lambda seconds: None)):
+        action_list = env.step(1, False, env.config['game']['goal'], action_duration)[5]
+    return len(action_list)
+
+
+def test_real_time_action_ticks():
+    env, clock = make_env()
+    assert not env.simulation_time
+    # the renderer paces the physics to 60 ticks per second of the clock
+    assert abs(action_ticks_of(env, clock) - action_ticks) <= 1
+
+
+@pytest.mark.parametrize('game', [{'render_every': 0}, {'render_every': 4, 'physics_fps': 240},
+                                  {'render_every': 1, 'physics_fps': 30}])
+def test_unpaced_action_ticks(game):
+    # without drawing or with physics faster or slower than real time, the actions last their duration in ticks
+    env, clock = make_env(**game)
+    assert env.simulation_time
+    assert action_ticks_of(env, clock) == action_ticks
+    assert env.game_ticks == action_ticks
+
+
+def test_faster_physics_take_less_time():
+    env, clock = make_env(render_every=4, physics_fps=240)
+    start = clock.now
+    action_ticks_of(env, clock)
+    assert clock.now - start == pytest.approx(action_duration / 4)
+
+
+def test_headless_action_ticks():
+    env, clock = make_env(headless=True)
+    assert env.renderer is None and env.simulation_time
+    assert action_ticks_of(env, clock) == action_ticks
+    assert action_ticks_of(env, clock) == action_ticks
+    assert env.game_ticks == 2 * action_ticks
+
+
+def test_simulation_time_ignores_the_clock():
+    env, clock = make_env(simulation_time=True)
+    # a loaded machine: every frame takes 100ms instead of 1/60 sec
+    env.renderer.tick = lambda fps: setattr(clock, 'now', clock.now + 0.1) or fps
+    assert action_ticks_of(env, clock) == action_ticks
+
+
+def test_simulation_time_timeout():
+    env, clock = make_env(headless=True)
+    max_duration = 1
+    for _ in range(int(max_duration / action_duration) - 1):
+        action_ticks_of(env, clock)
+    assert not env.is_timed_out(clock.now, 0, max_duration)
+    action_ticks_of(env, clock)
+    # the game lasted max_duration * fps ticks, although the clock did not move
+    assert env.is_timed_out(clock.now, 0, max_duration)
+
+
+def test_clone_restore_state_round_trip():
+    env, clock = make_env(headless=True)
+    action_ticks_of(env, clock)
+    snapshot = env.clone_state()
+    assert snapshot.shape == (Maze3D.state_size,)
+    # the branch played from the snapshot
+    action_ticks_of(env, clock)
+    branch = env.clone_state()
+    action_ticks_of(env, clock)
+
+    env.restore_state(snapshot)
+    np.testing.assert_array_equal(env.clone_state(), snapshot)
+    np.testing.assert_array_equal(env.observation, snapshot[:8])
+    assert env.game_ticks == action_ticks and not env.done
+    # the physics replay the same branch from the restored state
+    action_ticks_of(env, clock)
+    np.testing.assert_array_equal(env.clone_state(), branch)
+
+
+def test_clone_state_out():
+    env, clock = make_env(headless=True)
+    out = np.empty(Maze3D.state_size)
+    assert env.clone_state(out) is out
+    env.board.restoreState(out[:8] + 1)
+    np.testing.assert_array_equal(env.board.cloneState(), out[:8] + 1)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from maze3D_new.Maze3DEnv import Maze3D
+from maze3D_new.Maze3DPoolEnv import Maze3DPool
+from maze3D_new.VectorMaze3DEnv import VectorMaze3D
+from maze3D_new.utils import goals
+
+config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'game', 'config',
+                           'config_sac_28K_O-a.yaml')
+num_envs, num_steps, action_duration = 4, 10, 0.2
+
+
+def headless_config():
+    with open(config_file) as file:
+        config = yaml.safe_load(file)
+    config['game'].update(headless=True, agent_only=True)
+    return config
+
+
+def play(step, reset, place_ball, seed=0):
+    """
+    Plays seeded random actions on num_envs games. The ball of the first game starts on the goal, if place_ball is
+    given, and the third game times out on the fourth step.
+    :param step: function(actions, timed_out) of the games, returning their observations, rewards and dones
+    :param reset: function resetting all the games
+    :param place_ball: function(i, x, y) putting the ball of the i-th game, or None
+    :return: the observations, rewards and dones after every step
+    """
+    config = headless_config()
+    rng = np.random.RandomState(seed)
+    reset()
+    if place_ball is not None:
+        place_ball(0, *goals[config['game']['goal']])
+    history = []
+    for i in range(num_steps):
+        timed_out = np.arange(num_envs) == 2 if i == 3 else np.zeros(num_envs, dtype=bool)
+        history.append(step(rng.randint(0, 3, num_envs), timed_out))
+    return [np.array(values) for values in zip(*history)]
+
+
+def play_serial(config, on_goal=True):
+    """Plays the games with num_envs independent Maze3D games, a finished game gets 0 reward"""
+    envs = [Maze3D(config=config) for _ in range(num_envs)]
+
+    def step(actions, timed_out):
+        results = []
+        for env, action, timed_out_env in zip(envs, actions, timed_out):
+            if env.done:
+                results.append((env.observation, 0, True))
+            else:
+                results.append(env.step(int(action), bool(timed_out_env), config['game']['goal'], action_duration)[:3])
+        return [np.array(values) for values in zip(*results)]
+
+    def place_ball(i, x, y):
+        envs[i].board.ball.x, envs[i].board.ball.y = x, y
+
+    return play(step, lambda: [env.reset(countdown=False) for env in envs], place_ball if on_goal else None)
+
+
+def test_vector_maze3d_matches_independent_games():
+    config = headless_config()
+    vector = VectorMaze3D(num_envs, config=config)
+
+    def place_ball(i, x, y):
+        vector.x[i], vector.y[i] = x, y
+
+    observations, rewards, dones = play(
+        lambda actions, timed_out: vector.step(actions, timed_out, config['game']['goal'], action_duration),
+        vector.reset, place_ball)
+    expected_observations, expected_rewards, expected_dones = play_serial(config)
+
+    np.testing.assert_allclose(observations, expected_observations, rtol=0, atol=1e-10)
+    np.testing.assert_array_equal(dones, expected_dones)
+    np.testing.assert_array_equal(rewards, expected_rewards)
+    # the game on the goal finishes on the first step and gets the goal reward once, the timed out game on the fourth
+    assert dones[0, 0] and rewards[0, 0] == 100 and (rewards[1:, 0] == 0).all()
+    assert not dones[2, 2] and dones[3, 2] and (rewards[4:, 2] == 0).all()
+
+
+def test_maze3d_pool_matches_independent_games():
+    config = headless_config()
+    pool = Maze3DPool(num_envs, config=config, num_workers=2)
+    try:
+        assert len(pool.workers) == 2
+        observations, rewards, dones = play(
+            lambda actions, timed_out: pool.step(actions, timed_out, config['game']['goal'], action_duration),
+            pool.reset, None)
+    finally:
+        workers = pool.workers
+        pool.close()
+    assert pool.workers == [] and not any(process.is_alive() for process in workers)
+    expected_observations, expected_rewards, expected_dones = play_serial(config, on_goal=False)
+
+    np.testing.assert_array_equal(observations, expected_observations)
+    np.testing.assert_array_equal(dones, expected_dones)
+    np.testing.assert_array_equal(rewards, expected_rewards)
+    # the timed out game finishes on the fourth step and gets 0 reward after
+    assert not dones[2, 2] and dones[3, 2] and (rewards[4:, 2] == 0).all()
+
+
+def test_maze3d_pool_needs_a_reward_function():
+    config = headless_config()
+    config['SAC']['reward_function'] = 'unknown'
+    with pytest.raises(ValueError):
+        Maze3DPool(num_envs, config=config, num_workers=2)